@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# vim:fenc=utf-8 ff=unix ft=python ts=4 sw=4 sts=4 si et
+"""
+Compare the `scandir` distribution discovery engine of pip-licenses with
+`importlib.metadata.distributions` on a synthetic site-packages.
+
+Usage:
+    python benchmarks/bench_discovery.py [--count N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterable
+from importlib.metadata import distributions
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from piplicenses import scan_distributions
+
+METADATA = """\
+Metadata-Version: 2.1
+Name: package-{index}
+Version: 1.0.{index}
+License: MIT
+
+"""
+
+RUN_IDS = itertools.count()
+
+
+def create_site_packages(root: Path, count: int) -> None:
+    for index in range(count):
+        dist_info = root / f"package_{index}-1.0.{index}.dist-info"
+        dist_info.mkdir()
+        (dist_info / "METADATA").write_text(
+            METADATA.format(index=index), encoding="utf-8"
+        )
+        # the modules of the package are listed alongside the metadata
+        (root / f"package_{index}").mkdir()
+
+
+def measure(
+    func: Callable[[list[str]], Iterable[object]], site_packages: Path
+) -> float:
+    # importlib.metadata caches the lookups by path, but the CLI runs once
+    # per process: measure the first lookup of a path never seen before
+    search_path = site_packages.rename(
+        site_packages.with_name(f"site-packages-{next(RUN_IDS)}")
+    )
+    start = time.perf_counter()
+    count = sum(1 for _ in func([str(search_path)]))
+    elapsed = time.perf_counter() - start
+    search_path.rename(site_packages)
+    assert count > 0
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        site_packages = Path(tmp_dir, "site-packages")
+        site_packages.mkdir()
+        create_site_packages(site_packages, args.count)
+
+        def importlib_engine(search_paths: list[str]) -> Iterable[object]:
+            return distributions(path=search_paths)
+
+        print(
+            f"site-packages with {args.count} distributions "
+            f"(best of {args.repeat}):"
+        )
+        results = {}
+        for name, func in (
+            ("importlib", importlib_engine),
+            ("scandir", scan_distributions),
+        ):
+            best = min(
+                measure(func, site_packages) for _ in range(args.repeat)
+            )
+            results[name] = best
+            print(f"  {name:<10} {best:8.3f} s")
+        speedup = results["importlib"] / results["scandir"]
+        print(f"  speedup    {speedup:8.1f} x")
+
+
+if __name__ == "__main__":
+    main()
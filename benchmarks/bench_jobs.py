@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# vim:fenc=utf-8 ff=unix ft=python ts=4 sw=4 sts=4 si et
+"""
+Measure how the collection of the package information scales with the
+number of `--jobs` worker threads on a synthetic site-packages.
+
+The worker threads only run in parallel on a free-threaded build of
+Python, run the benchmark with both builds to compare them, e.g.:
+
+    python3.14 benchmarks/bench_jobs.py
+    python3.14t benchmarks/bench_jobs.py
+
+Usage:
+    python benchmarks/bench_jobs.py [--count N] [--jobs N [N ...]]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from piplicenses import create_parser, get_output_fields, get_packages
+
+METADATA = """\
+Metadata-Version: 2.1
+Name: package-{index}
+Version: 1.0.{index}
+Summary: A synthetic package used to benchmark the collection
+Author: Jane Doe
+License: MIT
+Classifier: License :: OSI Approved :: MIT License
+Classifier: Programming Language :: Python :: 3
+
+"""
+
+LICENSE = "Permission is hereby granted, free of charge, to any person.\n"
+
+
+def create_site_packages(root: Path, count: int) -> None:
+    for index in range(count):
+        name = f"package_{index}"
+        dist_info = root / f"{name}-1.0.{index}.dist-info"
+        dist_info.mkdir()
+        (dist_info / "METADATA").write_text(
+            METADATA.format(index=index), encoding="utf-8"
+        )
+        (dist_info / "LICENSE").write_text(LICENSE * 20, encoding="utf-8")
+        records = [f"{name}/module_{module}.py,," for module in range(50)]
+        records += [
+            f"{dist_info.name}/{file},,"
+            for file in ("METADATA", "LICENSE", "RECORD")
+        ]
+        (dist_info / "RECORD").write_text(
+            "\n".join(records) + "\n", encoding="utf-8"
+        )
+
+
+def measure(site_packages: Path, jobs: int) -> float:
+    parser = create_parser()
+    args = parser.parse_args(
+        ["--with-license-file", "--no-license-path", f"--jobs={jobs}"]
+    )
+    sys.path[:] = [str(site_packages)]
+    start = time.perf_counter()
+    count = sum(1 for _ in get_packages(args, get_output_fields(args)))
+    elapsed = time.perf_counter() - start
+    assert count > 0
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    sys_path = sys.path[:]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        site_packages = Path(tmp_dir)
+        create_site_packages(site_packages, args.count)
+
+        print(
+            f"{args.count} distributions, GIL "
+            f"{'enabled' if is_gil_enabled else 'disabled'} "
+            f"(best of {args.repeat}):"
+        )
+        results = {}
+        try:
+            for jobs in args.jobs:
+                best = min(
+                    measure(site_packages, jobs) for _ in range(args.repeat)
+                )
+                results[jobs] = best
+                speedup = results[args.jobs[0]] / best
+                print(f"  jobs={jobs:<4} {best:8.3f} s {speedup:6.1f} x")
+        finally:
+            sys.path[:] = sys_path
+
+
+if __name__ == "__main__":
+    main()
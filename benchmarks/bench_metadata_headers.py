@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# vim:fenc=utf-8 ff=unix ft=python ts=4 sw=4 sts=4 si et
+"""
+Compare the header-only METADATA parser of pip-licenses with the `email`
+parser behind `importlib.metadata.Distribution.metadata`.
+
+Usage:
+    python benchmarks/bench_metadata_headers.py [--count N] [--body-kb KB]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from importlib.metadata import PathDistribution
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from piplicenses import read_metadata_headers
+
+HEADERS = """\
+Metadata-Version: 2.1
+Name: package-{index}
+Version: 1.0.{index}
+Summary: A synthetic package used to benchmark METADATA parsing
+Home-page: https://example.com/package-{index}
+Author: Jane Doe
+Author-email: jane@example.com
+License: MIT
+Project-URL: Source, https://example.com/package-{index}/src
+Project-URL: Documentation, https://example.com/package-{index}/docs
+Classifier: License :: OSI Approved :: MIT License
+Classifier: Programming Language :: Python :: 3
+Classifier: Operating System :: OS Independent
+Requires-Python: >=3.9
+Description-Content-Type: text/markdown
+
+"""
+
+
+def create_site_packages(root: Path, count: int, body_kb: int) -> list[Path]:
+    body = ("Long description line of the package. " * 26 + "\n") * body_kb
+    paths = []
+    for index in range(count):
+        dist_info = root / f"package_{index}-1.0.{index}.dist-info"
+        dist_info.mkdir()
+        metadata = HEADERS.format(index=index) + body
+        (dist_info / "METADATA").write_text(metadata, encoding="utf-8")
+        paths.append(dist_info)
+    return paths
+
+
+def measure(func: Callable[[Path], object], paths: list[Path]) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        func(path)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--body-kb", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = create_site_packages(Path(tmp_dir), args.count, args.body_kb)
+
+        def email_parser(path: Path) -> object:
+            return PathDistribution(path).metadata["License"]
+
+        def header_parser(path: Path) -> object:
+            headers = read_metadata_headers(path)
+            assert headers is not None
+            return headers["License"]
+
+        print(
+            f"{args.count} METADATA files with a {args.body_kb} KB long "
+            f"description (best of {args.repeat}):"
+        )
+        results = {}
+        for name, func in (
+            ("email parser", email_parser),
+            ("header parser", header_parser),
+        ):
+            best = min(measure(func, paths) for _ in range(args.repeat))
+            results[name] = best
+            print(f"  {name:<14} {best:8.3f} s")
+        speedup = results["email parser"] / results["header parser"]
+        print(f"  speedup        {speedup:8.1f} x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# vim:fenc=utf-8 ff=unix ft=python ts=4 sw=4 sts=4 si et
+"""
+Compare the text table renderer of pip-licenses with `PrettyTable.get_string`
+on a table of packages with their license texts.
+
+Usage:
+    python benchmarks/bench_text_table.py [--count N] [--format STYLE]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from prettytable import PrettyTable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from piplicenses import (
+    create_parser,
+    factory_styled_table_with_args,
+    render_text_table,
+)
+
+FIELDS = ["Name", "Version", "License", "Author", "LicenseText"]
+
+LICENSE_TEXT = """\
+Copyright (c) {year} {author}
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+"""
+
+AUTHORS = ["Jane Doe", "Jürgen Müller", "山田 太郎", "Zoë Ó Briain"]
+
+
+def measure(func: Callable[[], str]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--format", default="plain")
+    parser.add_argument("--license-lines", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    table_args = create_parser().parse_args([f"--format={args.format}"])
+    table = factory_styled_table_with_args(table_args, FIELDS)
+    assert isinstance(table, PrettyTable)
+    for index in range(args.count):
+        author = AUTHORS[index % len(AUTHORS)]
+        # long license files repeat their terms, section after section
+        text = LICENSE_TEXT.format(year=2000 + index % 25, author=author)
+        text *= args.license_lines // text.count("\n")
+        table.add_row(
+            [f"package-{index}", f"1.0.{index}", "MIT", author, text]
+        )
+
+    def prettytable_engine() -> str:
+        return table.get_string(fields=FIELDS, sortby="Name")
+
+    def text_table_engine() -> str:
+        return render_text_table(table, FIELDS, "Name")
+
+    def wrapped_engine() -> str:
+        return render_text_table(table, FIELDS, "Name", max_cell_width=40)
+
+    assert prettytable_engine() == text_table_engine()
+
+    print(
+        f"{args.format} table of {args.count} packages with "
+        f"{args.license_lines} lines long license texts "
+        f"(best of {args.repeat}):"
+    )
+    results = {}
+    for name, func in (
+        ("prettytable", prettytable_engine),
+        ("text table", text_table_engine),
+        ("wrapped 40", wrapped_engine),
+    ):
+        best = min(measure(func) for _ in range(args.repeat))
+        results[name] = best
+        print(f"  {name:<12} {best:8.3f} s")
+    speedup = results["prettytable"] / results["text table"]
+    print(f"  speedup      {speedup:8.1f} x")
+
+
+if __name__ == "__main__":
+    main()
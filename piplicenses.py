@@ -30,21 +30,63 @@ SOFTWARE.
 from __future__ import annotations
 
 import argparse
+import asyncio
 import codecs
+import csv
+import hashlib
+import heapq
+import html
+import io
+import json
 import os
 import re
+import signal
+import socket
+import socketserver
+import stat
 import subprocess
 import sys
-from collections import Counter
-from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
+import tempfile
+import textwrap
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from collections.abc import (
+    AsyncIterator,
+    Callable,
+    Collection,
+    Generator,
+    Iterable,
+    Iterator,
+    Sequence,
+)
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import (
+    ExitStack,
+    contextmanager,
+    redirect_stderr,
+    redirect_stdout,
+    suppress,
+)
 from enum import Enum, auto
-from functools import partial
+from functools import cached_property, lru_cache, partial
 from importlib import metadata as importlib_metadata
-from importlib.metadata import Distribution
+from importlib.metadata import Distribution, PackagePath
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import TYPE_CHECKING, cast
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    ClassVar,
+    NoReturn,
+    TypeVar,
+    cast,
+    overload,
+)
 
-from prettytable import HRuleStyle, PrettyTable, RowType
+if sys.platform != "win32":
+    import fcntl
 
 if sys.version_info >= (3, 11):
     import tomllib
@@ -54,9 +96,20 @@ else:
 if TYPE_CHECKING:  # pragma: no cover
     from email.message import Message
 
+    from prettytable import PrettyTable
+
+    if sys.version_info >= (3, 10):
+        from importlib.metadata._meta import PackageMetadata, SimplePath
+    else:
+        from email.message import Message as PackageMetadata
+        from pathlib import Path as SimplePath
+
 
 open = open  # allow monkey patching
 
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
 __pkgname__ = "pip-licenses"
 __version__ = "5.5.5"
 __summary__ = (
@@ -76,6 +129,7 @@ FIELD_NAMES: set[str] = {
     "Maintainer",
     "Description",
     "URL",
+    "Environment",
 }
 
 SUMMARY_FIELD_NAMES: set[str] = {
@@ -93,7 +147,7 @@ SUMMARY_OUTPUT_FIELDS: set[str] = {
 }
 
 
-def extract_homepage(metadata: Message) -> str | None:
+def extract_homepage(metadata: Message | MetadataHeaders) -> str | None:
     """Extracts a homepage attribute from the package metadata.
 
     Retrieve home page from the PEP 753 `Project-URL` metadata.
@@ -280,6 +334,130 @@ def deduplicate_and_normalize(
             yield norm_pkg
 
 
+class MetadataHeaders:
+    """Headers of a METADATA (or PKG-INFO) file.
+
+    Implements the `PackageMetadata` interface of `Distribution.metadata`
+    for the headers only, names are looked up case-insensitively.
+    """
+
+    def __init__(self, headers: Iterable[tuple[str, str]]) -> None:
+        self._headers = list(headers)
+        self._values: dict[str, list[str]] = {}
+        for name, value in self._headers:
+            self._values.setdefault(name.lower(), []).append(value)
+
+    def __len__(self) -> int:
+        return len(self._headers)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.lower() in self._values
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, _ in self._headers)
+
+    def __getitem__(self, name: str) -> str:
+        values = self._values.get(name.lower())
+        if not values:
+            raise KeyError(name)
+        return values[0]
+
+    @overload
+    def get(self, name: str, failobj: None = None) -> str | None: ...
+
+    @overload
+    def get(self, name: str, failobj: _T) -> str | _T: ...
+
+    def get(self, name: str, failobj: _T | None = None) -> str | _T | None:
+        values = self._values.get(name.lower())
+        return values[0] if values else failobj
+
+    @overload
+    def get_all(self, name: str, failobj: None = None) -> list[str] | None: ...
+
+    @overload
+    def get_all(self, name: str, failobj: _T) -> list[str] | _T: ...
+
+    def get_all(
+        self, name: str, failobj: _T | None = None
+    ) -> list[str] | _T | None:
+        values = self._values.get(name.lower())
+        return list(values) if values else failobj
+
+    @property
+    def json(self) -> dict[str, str | list[str]]:
+        return {
+            name.replace("-", "_"): values if len(values) > 1 else values[0]
+            for name, values in self._values.items()
+        }
+
+
+def parse_metadata_headers(lines: Iterable[bytes]) -> MetadataHeaders:
+    """Parse the headers of a METADATA (or PKG-INFO) file.
+
+    Unlike the `email` parser behind `Distribution.metadata`, the parsing
+    stops at the first blank line, so the (potentially large) long
+    description in the body is never processed. Continuation lines are
+    handled the same way `importlib.metadata` does.
+
+    Args:
+        lines: The lines of the file, line endings included.
+
+    Returns:
+        The parsed headers.
+    """
+
+    def decode_value(value_lines: list[bytes]) -> str:
+        value = b"".join(value_lines).decode("utf-8", errors="replace")
+        value = value.replace("\r\n", "\n").rstrip("\r\n")
+        if "\n" in value:
+            # Correct for RFC822 indentation, as importlib.metadata does
+            value = textwrap.dedent(" " * 8 + value)
+        return value
+
+    headers: list[tuple[str, str]] = []
+    name: str | None = None
+    value_lines: list[bytes] = []
+    for line in lines:
+        if name is not None and line[:1] in (b" ", b"\t"):
+            value_lines.append(line)
+            continue
+
+        if name is not None:
+            headers.append((name, decode_value(value_lines)))
+            name = None
+
+        raw_name, sep, raw_value = line.partition(b":")
+        if not sep or not raw_name.strip():
+            # a blank line (or anything but a header) starts the body
+            break
+        name = raw_name.decode("utf-8", errors="replace")
+        value_lines = [raw_value.lstrip(b" \t")]
+
+    if name is not None:
+        headers.append((name, decode_value(value_lines)))
+
+    return MetadataHeaders(headers)
+
+
+METADATA_FILE_NAMES: tuple[str, ...] = ("METADATA", "PKG-INFO", "")
+
+
+def read_metadata_headers(path: Path) -> MetadataHeaders | None:
+    """Read the headers of the metadata of a distribution on disk.
+
+    Args:
+        path: Path of the .dist-info or .egg-info directory (or file).
+
+    Returns:
+        The parsed headers, None if no metadata file could be read.
+    """
+    for file_name in METADATA_FILE_NAMES:
+        with suppress(OSError), (path / file_name).open("rb") as metadata_file:
+            return parse_metadata_headers(metadata_file)
+    return None
+
+
 METADATA_KEYS: dict[str, list[Callable[[Message], str | None]]] = {
     "home-page": [extract_homepage],
     "author": [
@@ -307,6 +485,73 @@ FIELDS_TO_METADATA_KEYS: dict[str, str] = {
 }
 
 
+# Mapping of the kinds of included files to the file names they are found by
+INCLUDED_FILE_PATTERNS: dict[str, str] = {
+    "license": (
+        "[Ll][Ii][Cc][Ee][Nn][CScs][Ee].*|[Cc][Oo][Pp][Yy][Ii][Nn][Gg].*"
+    ),
+    "notice": "NOTICE.*",
+    "other": "[Aa][Uu][Tt][Hh][Oo][Rr][Ss].*",
+}
+
+# Matches any of INCLUDED_FILE_PATTERNS, the group name is the kind of file
+PATTERN_INCLUDED_FILES = re.compile(
+    "|".join(
+        f"(?P<{kind}>{pattern})"
+        for kind, pattern in INCLUDED_FILE_PATTERNS.items()
+    )
+)
+
+# Mapping of FIELD_NAMES to the kind of included file they are read from
+FIELDS_TO_INCLUDED_FILES: dict[str, str] = {
+    "LicenseFile": "license",
+    "LicenseText": "license",
+    "NoticeFile": "notice",
+    "NoticeText": "notice",
+}
+
+# METADATA_KEYS always extracted, as they are needed to select the license
+LICENSE_METADATA_KEYS: tuple[str, ...] = ("license", "license_expression")
+
+
+def select_included_files(output_fields: Iterable[str] | None) -> list[str]:
+    """Return the kinds of included files needed by the output fields.
+
+    Args:
+        output_fields: The fields that will be output, or None for all.
+
+    Returns:
+        The kinds of included files (see INCLUDED_FILE_PATTERNS) to read.
+    """
+    if output_fields is None:
+        return list(INCLUDED_FILE_PATTERNS)
+
+    kinds = {
+        FIELDS_TO_INCLUDED_FILES[field]
+        for field in output_fields
+        if field in FIELDS_TO_INCLUDED_FILES
+    }
+    return [kind for kind in INCLUDED_FILE_PATTERNS if kind in kinds]
+
+
+def select_metadata_keys(output_fields: Iterable[str] | None) -> list[str]:
+    """Return the METADATA_KEYS needed by the output fields.
+
+    Args:
+        output_fields: The fields that will be output, or None for all.
+
+    Returns:
+        The METADATA_KEYS to extract, the license related keys included.
+    """
+    if output_fields is None:
+        return list(METADATA_KEYS)
+
+    keys = set(LICENSE_METADATA_KEYS)
+    for field in output_fields:
+        keys.add(FIELDS_TO_METADATA_KEYS.get(field, field.lower()))
+    return [key for key in METADATA_KEYS if key in keys]
+
+
 SYSTEM_PACKAGES: list[str] = [
     __pkgname__,
     "pip",
@@ -321,141 +566,1371 @@ if sys.version_info < (3, 11):
 LICENSE_UNKNOWN: str = "UNKNOWN"
 
 
-def get_packages(
-    args: CustomNamespace,
-) -> Iterator[dict[str, str | list[str]]]:
-    def get_pkg_included_file(
-        pkg: Distribution, file_names_rgx: str
-    ) -> tuple[str, str]:
-        """
-        Attempt to find the package's included file on disk and return the
-        tuple (included_file_path, included_file_contents).
+class CachedDistribution(Distribution):
+    """Distribution reading and parsing its METADATA and RECORD only once.
+
+    `importlib.metadata` reads and parses these files again on each access
+    of `metadata`, `version` or `files`. The number of times each of them
+    was actually loaded is counted in `load_count`.
+    """
+
+    # Not functools.cached_property: before Python 3.12, it holds a lock
+    # shared by all the instances, which serializes the `--jobs` workers.
+
+    def __init__(self, dist: Distribution) -> None:
+        self._dist = dist
+        self._metadata: PackageMetadata | None = None
+        self._files: list[PackagePath] | None = None
+        self.load_count: Counter[str] = Counter()
+
+    @property
+    def path(self) -> Path | None:
+        """Path of the metadata directory, if the distribution has one."""
+        return get_metadata_path(self._dist)
+
+    @property
+    def metadata(self) -> PackageMetadata:
+        if self._metadata is None:
+            self._metadata = self._load_metadata()
+            self.load_count["metadata"] += 1
+        return self._metadata
+
+    def _load_metadata(self) -> PackageMetadata:
+        if self.path is not None:
+            headers = read_metadata_headers(self.path)
+            if headers is not None:
+                return headers
+        return self._dist.metadata
+
+    @property
+    def files(self) -> list[PackagePath] | None:
+        if not self.load_count["files"]:
+            self._files = self._dist.files
+            self.load_count["files"] += 1
+        return self._files
+
+    def read_text(self, filename: str) -> str | None:
+        return self._dist.read_text(filename)
+
+    def locate_file(self, path: str | os.PathLike[str]) -> SimplePath:
+        return self._dist.locate_file(path)
+
+
+def write_json_atomically(path: Path, data: object) -> None:
+    """Write a JSON file, replacing it with an atomic rename so that the
+    readers never see a partially written file.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_name, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp_name)
+        raise
+
+
+class PackageInfoCache:
+    """On-disk cache of the information extracted from the distributions.
+
+    Each entry is a JSON file named after a hash of the path of the
+    .dist-info directory, of the mtime, size and inode of its METADATA and
+    RECORD files, and of the extraction options. Entries are written with
+    atomic renames so that concurrent runs can share a cache directory. The
+    least recently used entries are evicted, under a lock file, once the
+    cache grows beyond `max_size` bytes.
+
+    If the cache directory cannot be created, the cache is disabled with a
+    warning: the entries cannot be read, and their writes are ignored.
+    """
+
+    # The cache directories already warned about as unusable
+    unusable_dirs: ClassVar[set[str]] = set()
+
+    def __init__(
+        self, cache_dir: str, max_size: int, options: Iterable[str]
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.options = list(options)
+        self.modified = False
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as error:
+            if cache_dir not in self.unusable_dirs:
+                self.unusable_dirs.add(cache_dir)
+                sys.stderr.write(
+                    f"cache disabled, check path: --cache-dir ({error})\n"
+                )
+
+    def get_entry_path(self, pkg: Distribution) -> Path | None:
+        """Return the path of the entry of a distribution, None if the
+        distribution cannot be cached (it is not a .dist-info directory).
         """
-        included_file = LICENSE_UNKNOWN
-        included_text = LICENSE_UNKNOWN
+        metadata_path = get_metadata_path(pkg)
+        if metadata_path is None or metadata_path.suffix != ".dist-info":
+            return None
 
-        pkg_files = pkg.files or ()
-        pattern = re.compile(file_names_rgx)
-        matched_rel_paths = filter(
-            lambda file: pattern.match(file.name), pkg_files
+        key = json.dumps(
+            [
+                __version__,
+                str(metadata_path),
+                get_file_identity(metadata_path / "METADATA"),
+                get_file_identity(metadata_path / "RECORD"),
+                self.options,
+            ]
         )
-        for rel_path in matched_rel_paths:
-            abs_path = Path(str(pkg.locate_file(rel_path)))
-            if not abs_path.is_file():
-                continue
-            included_file = str(abs_path)
-            with open(
-                abs_path, encoding="utf-8", errors="backslashreplace"
-            ) as included_file_handle:
-                included_text = included_file_handle.read()
-            break
-        return (included_file, included_text)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{digest}.json"
+
+    def get_report_path(self, fingerprint: str) -> Path:
+        """Return the path of the entry of the report of an environment."""
+        return self.cache_dir / f"report-{fingerprint}.json"
+
+    def get_probe_path(self, python: str) -> Path | None:
+        """Return the path of the entry of the `sys.path` of a python, None
+        if the executable is missing.
+        """
+        identity = get_file_identity(Path(python))
+        if identity is None:
+            return None
+
+        key = json.dumps([__version__, python, identity])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"probe-{digest}.json"
 
-    def get_pkg_info(pkg: Distribution) -> dict[str, str | list[str]]:
-        license_file, license_text = get_pkg_included_file(
-            pkg,
-            "[Ll][Ii][Cc][Ee][Nn][CScs][Ee].*|[Cc][Oo][Pp][Yy][Ii][Nn][Gg].*",
+    def load(self, entry_path: Path) -> dict[str, str | list[str]] | None:
+        """Return the information stored in an entry, None if missing."""
+        try:
+            with entry_path.open(encoding="utf-8") as entry_file:
+                pkg_info = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        # the mtime of the entries tells the least recently used ones
+        with suppress(OSError):
+            os.utime(entry_path)
+        return pkg_info
+
+    def store(
+        self, entry_path: Path, pkg_info: dict[str, str | list[str]]
+    ) -> None:
+        """Write an entry, errors are ignored as the cache is optional."""
+        with suppress(OSError):
+            write_json_atomically(entry_path, pkg_info)
+            self.modified = True
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold the lock file of the cache directory."""
+        with (self.cache_dir / ".lock").open("a") as lock_file:
+            if sys.platform != "win32":
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def evict(self) -> None:
+        """Remove the least recently used entries beyond `max_size`."""
+        if not self.modified:
+            return
+
+        with self.lock():
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    with suppress(OSError):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry))
+
+            size = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, entry in sorted(entries, key=itemgetter(0)):
+                if size <= self.max_size:
+                    break
+                with suppress(OSError):
+                    os.unlink(entry.path)
+                size -= entry_size
+        self.modified = False
+
+
+class PackageInfoState:
+    """State file of the information extracted by the previous run.
+
+    The information of each distribution is stored along with the mtime of
+    its metadata directory. Only the distributions added or changed since
+    the previous run are extracted again, the information of the others is
+    carried over.
+    """
+
+    def __init__(self, path: str, options: Iterable[str]) -> None:
+        self.path = Path(path)
+        self.options = list(options)
+        self.distributions: dict[str, dict] = {}
+        self.used: set[str] = set()
+        self.stored: set[str] = set()
+        self.modified = False
+
+        state: dict = {}
+        with (
+            suppress(OSError, ValueError),
+            self.path.open(encoding="utf-8") as state_file,
+        ):
+            state = json.load(state_file)
+        if (
+            state.get("pip-licenses") == __version__
+            and state.get("options") == self.options
+        ):
+            self.distributions = state["distributions"]
+
+    def get_entry(self, pkg: Distribution) -> tuple[str, int] | None:
+        """Return the key and the mtime of the metadata directory of a
+        distribution, None if it has no metadata directory on disk.
+        """
+        metadata_path = get_metadata_path(pkg)
+        if metadata_path is None:
+            return None
+        try:
+            mtime = metadata_path.stat().st_mtime_ns
+        except OSError:
+            return None
+        return (str(metadata_path), mtime)
+
+    def load(
+        self, entry: tuple[str, int]
+    ) -> dict[str, str | list[str]] | None:
+        """Return the information of an unchanged distribution."""
+        key, mtime = entry
+        self.used.add(key)
+        stored = self.distributions.get(key)
+        if stored is None or stored["mtime"] != mtime:
+            return None
+
+        pkg_info = stored["pkg_info"]
+        dist_info = parse_dist_info_dirname(Path(key).name)
+        if dist_info is not None and dist_info != (
+            normalize_pkg_name(pkg_info["name"]),
+            pkg_info["version"],
+        ):
+            return None
+        return pkg_info
+
+    def store(
+        self, entry: tuple[str, int], pkg_info: dict[str, str | list[str]]
+    ) -> None:
+        """Store the information of a distribution added or changed."""
+        key, mtime = entry
+        self.distributions[key] = {"mtime": mtime, "pkg_info": pkg_info}
+        self.stored.add(key)
+        self.modified = True
+
+    def save(self) -> None:
+        """Write the state file, without the removed distributions.
+
+        Errors are ignored, the next run extracts everything again.
+        """
+        for key in set(self.distributions) - self.used:
+            if not os.path.exists(key):
+                del self.distributions[key]
+                self.modified = True
+        if not self.modified:
+            return
+
+        with suppress(OSError):
+            write_json_atomically(
+                self.path,
+                {
+                    "pip-licenses": __version__,
+                    "options": self.options,
+                    "distributions": self.distributions,
+                },
+            )
+        self.modified = False
+
+
+def get_file_identity(path: Path) -> tuple[int, int, int] | None:
+    """Return the mtime, size and inode of a file, None if missing."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def get_metadata_path(dist: Distribution) -> Path | None:
+    """Return the path of the .dist-info (or .egg-info) of a distribution.
+
+    Args:
+        dist: The distribution.
+
+    Returns:
+        The path, None if the metadata is not in a directory on disk.
+    """
+    if isinstance(dist, CachedDistribution):
+        return dist.path
+    path = getattr(dist, "_path", None)
+    return path if isinstance(path, Path) else None
+
+
+def get_pkg_included_files(
+    pkg: Distribution, kinds: Iterable[str]
+) -> dict[str, tuple[str, str]]:
+    """Find the package's included files of the given kinds on disk.
+
+    The license files declared by the PEP 639 `License-File` headers are
+    looked up first, in the `licenses` directory of the metadata directory
+    (or in the metadata directory itself, as older setuptools do). The
+    declared files named like a license file are preferred to the others
+    (AUTHORS, NOTICE...), which are only used if none is.
+    Otherwise, the files of the package (from RECORD) are classified in a
+    single pass, then for each kind the first candidate existing on disk is
+    read.
+
+    Args:
+        pkg: The distribution of the package.
+        kinds: The kinds of included files (see INCLUDED_FILE_PATTERNS).
+
+    Returns:
+        Mapping of each kind to the tuple (included_file_path,
+        included_file_contents), both LICENSE_UNKNOWN if not found.
+    """
+    included_files: dict[str, tuple[str, str]] = dict.fromkeys(
+        kinds, (LICENSE_UNKNOWN, LICENSE_UNKNOWN)
+    )
+    candidates: dict[str, list[PackagePath]] = {
+        kind: [] for kind in included_files
+    }
+
+    metadata_path = get_metadata_path(pkg)
+    if "license" in candidates and metadata_path is not None:
+        declared_paths = []
+        named_license_paths = []
+        for license_file in pkg.metadata.get_all("License-File", []):
+            rel_path = Path(license_file)
+            if rel_path.is_absolute() or ".." in rel_path.parts:
+                continue
+            declared_paths.append(rel_path)
+            match = PATTERN_INCLUDED_FILES.match(rel_path.name)
+            if match is not None and match.lastgroup == "license":
+                named_license_paths.append(rel_path)
+
+        license_file_paths = []
+        for rel_path in named_license_paths or declared_paths:
+            license_file_paths.append(metadata_path / "licenses" / rel_path)
+            license_file_paths.append(metadata_path / rel_path)
+
+        license_file = read_pkg_included_file(license_file_paths)
+        if license_file[0] != LICENSE_UNKNOWN:
+            included_files["license"] = license_file
+            del candidates["license"]
+
+    if not candidates:
+        return included_files
+
+    for file in pkg.files or ():
+        match = PATTERN_INCLUDED_FILES.match(file.name)
+        if match is not None and match.lastgroup in candidates:
+            candidates[match.lastgroup].append(file)
+
+    for kind, rel_paths in candidates.items():
+        included_files[kind] = read_pkg_included_file(
+            Path(str(pkg.locate_file(rel_path))) for rel_path in rel_paths
         )
-        notice_file, notice_text = get_pkg_included_file(pkg, "NOTICE.*")
-        other_file, other_text = get_pkg_included_file(
-            pkg,
-            "[Aa][Uu][Tt][Hh][Oo][Rr][Ss].*",
+    return included_files
+
+
+def read_pkg_included_file(abs_paths: Iterable[Path]) -> tuple[str, str]:
+    """
+    Read the first of the candidate files existing on disk and return the
+    tuple (included_file_path, included_file_contents).
+    """
+    for abs_path in abs_paths:
+        if not abs_path.is_file():
+            continue
+        with open(
+            abs_path, encoding="utf-8", errors="backslashreplace"
+        ) as included_file_handle:
+            return (str(abs_path), included_file_handle.read())
+    return (LICENSE_UNKNOWN, LICENSE_UNKNOWN)
+
+
+def find_distributions(
+    search_paths: list[str], names: Collection[str] | None = None
+) -> Iterator[Distribution]:
+    """Find the distributions with `importlib.metadata`.
+
+    Args:
+        search_paths: The search paths, as in `sys.path`.
+        names: The normalized names of the distributions to look up
+               directly, or None for all the distributions.
+
+    Yields:
+        The distributions found.
+    """
+    if names is None:
+        yield from importlib_metadata.distributions(path=search_paths)
+        return
+
+    for name in names:
+        yield from importlib_metadata.distributions(
+            name=name, path=search_paths
         )
-        pkg_info: dict[str, str | list[str]] = {
-            "name": pkg.metadata["name"],
-            "version": pkg.version,
-            "namever": "{} {}".format(pkg.metadata["name"], pkg.version),
-            "licensefile": license_file,
-            "licensetext": license_text,
-            "noticefile": notice_file,
-            "noticetext": notice_text,
-            "otherfile": other_file,
-            "othertext": other_text,
+
+
+def scan_distributions(
+    search_paths: Iterable[str], names: Collection[str] | None = None
+) -> Iterator[Distribution]:
+    """Discover the distributions by scanning each search path only once.
+
+    The `*.dist-info` and `*.egg-info` entries of the directories are
+    recognized by their names directly, without the finder machinery of
+    `importlib.metadata`. The search paths which are not directories (zip
+    files) or are eggs are delegated to `importlib.metadata`.
+
+    Args:
+        search_paths: The search paths, as in `sys.path`.
+        names: The normalized names of the distributions to look up, or
+               None for all the distributions. The entries of other
+               distributions are skipped on their names.
+
+    Yields:
+        The distributions found, in the order of the search paths.
+    """
+    for search_path in search_paths:
+        if search_path.lower().endswith(".egg"):
+            yield from find_distributions([search_path], names)
+            continue
+
+        try:
+            entries = os.scandir(search_path or ".")
+        except OSError:
+            # missing paths have no distributions, zip files are delegated
+            if os.path.isfile(search_path):
+                yield from find_distributions([search_path], names)
+            continue
+
+        with entries:
+            for entry in entries:
+                stem, _, suffix = entry.name.lower().rpartition(".")
+                if suffix not in ("dist-info", "egg-info"):
+                    continue
+                if (
+                    names is not None
+                    and normalize_pkg_name(stem.partition("-")[0]) not in names
+                ):
+                    continue
+                yield importlib_metadata.PathDistribution(Path(entry.path))
+
+
+def deduplicate_search_paths(search_paths: Iterable[str]) -> list[str]:
+    """Remove the search paths resolving to a path already seen.
+
+    Args:
+        search_paths: The search paths, as in `sys.path`.
+
+    Returns:
+        The first of the search paths resolving to each real path.
+    """
+    real_paths: set[str] = set()
+    unique_search_paths = []
+    for search_path in search_paths:
+        real_path = os.path.realpath(search_path or ".")
+        if real_path not in real_paths:
+            real_paths.add(real_path)
+            unique_search_paths.append(search_path)
+    return unique_search_paths
+
+
+def get_distribution_key(dist: Distribution) -> str:
+    """Return the normalized name of the project of a distribution.
+
+    The name is read from the name of the metadata directory when possible,
+    as `importlib.metadata` does, and from the metadata otherwise.
+    """
+    path = get_metadata_path(dist)
+    if path is not None and path.suffix.lower() in (".dist-info", ".egg-info"):
+        return normalize_pkg_name(path.stem.partition("-")[0])
+    return normalize_pkg_name(dist.metadata["name"] or "")
+
+
+def deduplicate_distributions(
+    dists: Iterable[Distribution],
+    on_shadowed: Callable[[Distribution, Distribution], None] | None = None,
+) -> Iterator[Distribution]:
+    """Yield only the first distribution of each project.
+
+    As the import system does, the distributions found first in the search
+    paths shadow the ones of the same project found after them.
+
+    Args:
+        dists: The distributions, in the order of the search paths.
+        on_shadowed: Called with each shadowed distribution and the
+                     distribution shadowing it.
+
+    Yields:
+        The distributions which are not shadowed.
+    """
+    found: dict[str, Distribution] = {}
+    for dist in dists:
+        key = get_distribution_key(dist)
+        if key not in found:
+            found[key] = dist
+            yield dist
+        elif on_shadowed is not None:
+            on_shadowed(dist, found[key])
+
+
+def parse_dist_info_dirname(dirname: str) -> tuple[str, str] | None:
+    """Return the normalized name and the version encoded in the name of a
+    `.dist-info` directory (see PEP 427 and PEP 491).
+
+    Args:
+        dirname: Name of the metadata directory, e.g. `foo_bar-1.0.dist-info`
+
+    Returns:
+        The tuple (name, version), or None if the directory name is not
+        unambiguously `{name}-{version}.dist-info`.
+    """
+    stem, dot, suffix = dirname.rpartition(".")
+    if not dot or suffix.lower() != "dist-info" or stem.count("-") != 1:
+        return None
+    name, version = stem.split("-")
+    if not name or not version:
+        return None
+    return normalize_pkg_name(name), version
+
+
+def get_python_sys_path(executable: str) -> list[str]:
+    script = "import sys; print(' '.join(filter(bool, sys.path)))"
+    output = subprocess.run(
+        [executable, "-c", script],
+        capture_output=True,
+        env={**os.environ, "PYTHONPATH": "", "VIRTUAL_ENV": ""},
+    )
+    return output.stdout.decode().strip().split()
+
+
+def get_pythons(args: CustomNamespace) -> list[str]:
+    """Return the python executables selected by `--python` and
+    `--python-file`, without duplicates.
+
+    `args.python` may still be a single executable, as set by library
+    callers written before `--python` could be repeated.
+    """
+    if isinstance(args.python, str):
+        pythons = [args.python]
+    else:
+        pythons = list(args.python)
+    if args.python_file:
+        with open(args.python_file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    pythons.append(line)
+    return list(dict.fromkeys(pythons)) or [sys.executable]
+
+
+def get_python_search_paths(
+    python: str, cache: PackageInfoCache | None = None
+) -> list[str]:
+    """Return the search paths of a python, without duplicates.
+
+    With a cache, the `sys.path` of a python is only probed again when its
+    executable or one of the search paths changed (e.g. a .pth file was
+    installed in its site-packages).
+    """
+    if python == sys.executable:
+        return deduplicate_search_paths(sys.path)
+
+    entry_path = cache.get_probe_path(python) if cache is not None else None
+    if cache is not None and entry_path is not None:
+        probe = cast(dict, cache.load(entry_path))
+        if probe is not None and probe["mtimes"] == get_search_paths_mtimes(
+            probe["sys_path"]
+        ):
+            return deduplicate_search_paths(probe["sys_path"])
+
+    search_paths = get_python_sys_path(python)
+    if cache is not None and entry_path is not None:
+        probe = {
+            "sys_path": search_paths,
+            "mtimes": get_search_paths_mtimes(search_paths),
         }
-        metadata = pkg.metadata
-        for field_name, field_selector_fns in METADATA_KEYS.items():
-            value = None
-            for field_selector_fn in field_selector_fns:
-                # Type hint of `Distribution.metadata` states `PackageMetadata`
-                # but it's actually of type `email.Message`
-                value = field_selector_fn(metadata)  # type: ignore[arg-type]
-                if value:
-                    break
-            pkg_info[field_name] = value or LICENSE_UNKNOWN
+        cache.store(entry_path, cast(dict, probe))
+    return deduplicate_search_paths(search_paths)
+
+
+def get_search_paths_mtimes(search_paths: list[str]) -> list[int | None]:
+    identities = map(get_file_identity, map(Path, search_paths))
+    return [identity and identity[0] for identity in identities]
+
+
+# Runs in the target python of --collect-in-target, with the standard
+# library only. Writes a JSON line per distribution, with the headers of its
+# metadata and the files which may be included files (see
+# PATTERN_INCLUDED_FILES, given as the first argument).
+TARGET_COLLECTOR_SCRIPT = """\
+import json, pathlib, re, sys
+from importlib import metadata
+
+pattern = re.compile(sys.argv[1]) if len(sys.argv) > 1 else None
+# skip the current directory put first on sys.path by -c
+for dist in metadata.distributions(path=[p for p in sys.path if p]):
+    if not dist.metadata:
+        continue
+    path = getattr(dist, "_path", None)
+    files = None
+    if pattern is not None and dist.files is not None:
+        files = [str(file) for file in dist.files if pattern.match(file.name)]
+    record = {
+        "path": str(path) if isinstance(path, pathlib.Path) else None,
+        "root": str(dist.locate_file("")),
+        "headers": list(dist.metadata.items()),
+        "files": files,
+    }
+    sys.stdout.write(json.dumps(record, separators=(",", ":")) + "\\n")
+"""
+
+
+class TargetDistribution(Distribution):
+    """Distribution found by TARGET_COLLECTOR_SCRIPT in a target python.
 
-        classifiers: list[str] = metadata.get_all("classifier", [])
-        pkg_info["license_classifier"] = find_license_from_classifier(
-            classifiers
+    `files` only lists the files which may be included files, the files
+    themselves are read from the disk.
+    """
+
+    def __init__(self, record: dict) -> None:
+        self._path = Path(record["path"]) if record["path"] else None
+        self._root = Path(record["root"])
+        self._metadata = MetadataHeaders(map(tuple, record["headers"]))
+        self._files: list[str] | None = record["files"]
+
+    @property
+    def metadata(self) -> PackageMetadata:
+        return self._metadata
+
+    @property
+    def files(self) -> list[PackagePath] | None:
+        if self._files is None:
+            return None
+        files = []
+        for name in self._files:
+            file = PackagePath(name)
+            file.dist = self
+            files.append(file)
+        return files
+
+    def read_text(self, filename: str) -> str | None:
+        if self._path is None:
+            return None
+        with suppress(OSError):
+            return (self._path / filename).read_text(encoding="utf-8")
+        return None
+
+    def locate_file(self, path: str | os.PathLike[str]) -> SimplePath:
+        return self._root / path
+
+
+def collect_in_target(python: str, with_files: bool) -> Iterator[Distribution]:
+    """Discover the distributions of a python with its own
+    `importlib.metadata`, by running TARGET_COLLECTOR_SCRIPT in it.
+
+    Args:
+        python: The python executable.
+        with_files: Whether to list the files which may be included files.
+
+    Yields:
+        The distributions, as they are streamed by the target python.
+    """
+    command = [python, "-c", TARGET_COLLECTOR_SCRIPT]
+    if with_files:
+        command.append(PATTERN_INCLUDED_FILES.pattern)
+    with subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        env={**os.environ, "PYTHONPATH": "", "VIRTUAL_ENV": ""},
+    ) as process:
+        for line in cast(IO[bytes], process.stdout):
+            yield TargetDistribution(json.loads(line))
+    if process.returncode != 0:
+        sys.stderr.write(
+            f"collector failed in {python} (exit code {process.returncode})\n"
+        )
+        sys.exit(1)
+
+
+def get_search_paths(args: CustomNamespace) -> list[str]:
+    """Return the search paths of the selected pythons, without
+    duplicates. The pythons are run concurrently.
+    """
+    cache = (
+        PackageInfoCache(args.cache_dir, args.cache_max_size * 1024 * 1024, [])
+        if args.cache_dir
+        else None
+    )
+    pythons = get_pythons(args)
+    search_paths = list(
+        map_with_jobs(
+            partial(get_python_search_paths, cache=cache),
+            pythons,
+            min(32, len(pythons)),
         )
+    )
+    if cache is not None:
+        cache.evict()
+    return deduplicate_search_paths(chain.from_iterable(search_paths))
+
+
+# Options which have no effect on the output string
+FINGERPRINT_IGNORED_OPTIONS = (
+    "output_file",
+    "jobs",
+    "processes",
+    "discovery",
+    "report_shadowed",
+    "cache_dir",
+    "cache_max_size",
+    "cache_report",
+    "fingerprint",
+    "write_snapshot",
+    "state_file",
+    "serve",
+    "query",
+    "frozen_distributions",
+)
 
-        if args.filter_strings:
 
-            def filter_string(item: str) -> str:
-                return item.encode(
-                    args.filter_code_page, errors="ignore"
-                ).decode(args.filter_code_page)
+def get_environment_fingerprint(args: CustomNamespace) -> str:
+    """Return a hash of the installed distributions and of the options.
 
-            for k, v in pkg_info.items():
-                if isinstance(v, list):
-                    pkg_info[k] = list(map(filter_string, v))
-                else:
-                    pkg_info[k] = filter_string(cast(str, v))
+    The distributions are only told by the names and the mtimes of their
+    metadata directories (or of the zip files, or of the snapshots) in the
+    search paths, so the fingerprint is cheap to compute: no metadata is
+    read.
 
-        return pkg_info
+    Args:
+        args: The parsed command-line options.
+
+    Returns:
+        The hexadecimal SHA-256 fingerprint.
+    """
+    distributions = []
+    for search_path in get_search_paths(args):
+        if args.snapshots:
+            with suppress(OSError):
+                st = os.stat(Path(search_path or ".", SNAPSHOT_FILE_NAME))
+                mtime = st.st_mtime_ns
+                distributions.append([search_path, SNAPSHOT_FILE_NAME, mtime])
+                continue
+
+        try:
+            entries = os.scandir(search_path or ".")
+        except OSError:
+            with suppress(OSError):
+                st = os.stat(search_path)
+                distributions.append([search_path, "", st.st_mtime_ns])
+            continue
+
+        with entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(
+                    (".dist-info", ".egg-info")
+                ):
+                    continue
+                with suppress(OSError):
+                    mtime = entry.stat().st_mtime_ns
+                    distributions.append([search_path, entry.name, mtime])
+
+    options = {
+        name: value
+        for name, value in sorted(vars(args).items())
+        if name not in FINGERPRINT_IGNORED_OPTIONS
+    }
+    fingerprint = json.dumps(
+        [__version__, get_pythons(args), sorted(distributions), options],
+        default=str,
+    )
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def get_pkg_info(
+    pkg: Distribution,
+    included_files: Iterable[str],
+    metadata_keys: Iterable[str],
+) -> dict[str, str | list[str]]:
+    """Extract the information of a package from its distribution.
+
+    Args:
+        pkg: The distribution of the package.
+        included_files: The kinds of included files to read.
+        metadata_keys: The METADATA_KEYS to extract.
+
+    Returns:
+        The information of the package, before --filter-strings applies.
+    """
+    pkg_info: dict[str, str | list[str]] = {
+        "name": pkg.metadata["name"],
+        "version": pkg.version,
+        "namever": "{} {}".format(pkg.metadata["name"], pkg.version),
+    }
+    pkg_included_files = get_pkg_included_files(pkg, included_files)
+    for kind, (included_file, included_text) in pkg_included_files.items():
+        pkg_info[f"{kind}file"] = included_file
+        pkg_info[f"{kind}text"] = included_text
+
+    metadata = pkg.metadata
+    for field_name in metadata_keys:
+        field_selector_fns = METADATA_KEYS[field_name]
+        value = None
+        for field_selector_fn in field_selector_fns:
+            # Type hint of `Distribution.metadata` states `PackageMetadata`
+            # but it's actually of type `email.Message`
+            value = field_selector_fn(metadata)  # type: ignore[arg-type]
+            if value:
+                break
+        pkg_info[field_name] = value or LICENSE_UNKNOWN
+
+    classifiers: list[str] = metadata.get_all("classifier", [])
+    pkg_info["license_classifier"] = find_license_from_classifier(classifiers)
+    return pkg_info
+
+
+SNAPSHOT_FILE_NAME = ".pip-licenses-snapshot.json"
+
+
+class FrozenDistribution(Distribution):
+    """Distribution of a snapshot, holding the information of the package
+    extracted when the snapshot was written.
+    """
+
+    def __init__(
+        self, path: Path, pkg_info: dict[str, str | list[str]]
+    ) -> None:
+        self._path = path
+        self.pkg_info = pkg_info
 
-    def get_python_sys_path(executable: str) -> list[str]:
-        script = "import sys; print(' '.join(filter(bool, sys.path)))"
-        output = subprocess.run(
-            [executable, "-c", script],
-            capture_output=True,
-            env={**os.environ, "PYTHONPATH": "", "VIRTUAL_ENV": ""},
+    @cached_property
+    def metadata(self) -> PackageMetadata:
+        return MetadataHeaders(
+            [
+                ("Name", cast(str, self.pkg_info["name"])),
+                ("Version", cast(str, self.pkg_info["version"])),
+            ]
         )
-        return output.stdout.decode().strip().split()
 
-    if args.python == sys.executable:
-        search_paths = sys.path
-    else:
-        search_paths = get_python_sys_path(args.python)
+    def read_text(self, filename: str) -> str | None:
+        return None
+
+    def locate_file(self, path: str | os.PathLike[str]) -> SimplePath:
+        return self._path.parent / path
+
+
+def write_snapshot(site_dir: str) -> Path:
+    """Write the snapshot of the distributions of a site directory.
+
+    The information of all the distributions is extracted, as if all the
+    fields were output, and written into SNAPSHOT_FILE_NAME in `site_dir`.
 
-    pkgs = importlib_metadata.distributions(path=search_paths)
-    ignore_pkgs_as_normalize = [
-        normalize_pkg_name_and_version(pkg) for pkg in args.ignore_packages
+    Args:
+        site_dir: The site directory, e.g. a site-packages directory.
+
+    Returns:
+        The path of the snapshot.
+    """
+    included_files = list(INCLUDED_FILE_PATTERNS)
+    metadata_keys = list(METADATA_KEYS)
+    distributions = []
+    for dist in deduplicate_distributions(
+        map(CachedDistribution, scan_distributions([site_dir]))
+    ):
+        metadata_path = get_metadata_path(dist)
+        if metadata_path is not None:
+            distributions.append(
+                {
+                    "path": metadata_path.name,
+                    "pkg_info": get_pkg_info(
+                        dist, included_files, metadata_keys
+                    ),
+                }
+            )
+
+    snapshot_path = Path(site_dir, SNAPSHOT_FILE_NAME)
+    write_json_atomically(
+        snapshot_path,
+        {"pip-licenses": __version__, "distributions": distributions},
+    )
+    return snapshot_path
+
+
+def read_snapshot(search_path: str) -> list[FrozenDistribution] | None:
+    """Read the snapshot of a search path.
+
+    Args:
+        search_path: The search path, as in `sys.path`.
+
+    Returns:
+        The distributions of the snapshot, None if the search path has no
+        snapshot (or one written by another version of pip-licenses).
+    """
+    site_dir = Path(search_path or ".")
+    try:
+        with (site_dir / SNAPSHOT_FILE_NAME).open(encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("pip-licenses") != __version__:
+        return None
+    return [
+        FrozenDistribution(site_dir / entry["path"], entry["pkg_info"])
+        for entry in snapshot["distributions"]
     ]
-    pkgs_as_normalize = list(deduplicate_and_normalize(args.packages))
 
-    fail_on_licenses = set()
-    if args.fail_on:
-        # filter None types out
-        fail_on_licenses = set(
-            filter(None, map(str.strip, args.fail_on.split(";")))
+
+def scan_metadata_mtimes(search_path: str) -> Iterator[tuple[str, int]]:
+    """Yield the path and the mtime of each metadata directory (or file) of
+    a search path, nothing if the search path is not a directory.
+    """
+    try:
+        entries = os.scandir(search_path or ".")
+    except OSError:
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.name.lower().endswith((".dist-info", ".egg-info")):
+                with suppress(OSError):
+                    yield (entry.path, entry.stat().st_mtime_ns)
+
+
+class PackageIndex:
+    """In-memory index of the packages installed in the search paths.
+
+    The information of all the packages is extracted once, as if all the
+    fields were output. Then `refresh()` only extracts again the packages
+    whose metadata directory was added or changed since the previous call.
+    Only the directories of the search paths are indexed.
+    """
+
+    def __init__(self, search_paths: Iterable[str]) -> None:
+        self.entries: dict[str, dict[str, tuple[int, FrozenDistribution]]]
+        self.entries = {search_path: {} for search_path in search_paths}
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Update the index, return True if any package changed."""
+        changed = False
+        for search_path, entries in self.entries.items():
+            new_entries = {}
+            for path, mtime in scan_metadata_mtimes(search_path):
+                entry = entries.get(path)
+                if entry is None or entry[0] != mtime:
+                    dist = CachedDistribution(
+                        importlib_metadata.PathDistribution(Path(path))
+                    )
+                    pkg_info = get_pkg_info(
+                        dist, list(INCLUDED_FILE_PATTERNS), list(METADATA_KEYS)
+                    )
+                    entry = (mtime, FrozenDistribution(Path(path), pkg_info))
+                    changed = True
+                new_entries[path] = entry
+            changed = changed or new_entries.keys() != entries.keys()
+            self.entries[search_path] = new_entries
+        return changed
+
+    def distributions(self) -> dict[str, list[FrozenDistribution]]:
+        """Return the distributions of each search path."""
+        return {
+            search_path: [dist for _, dist in entries.values()]
+            for search_path, entries in self.entries.items()
+        }
+
+
+# Options writing files on the server, which the clients may not choose
+QUERY_REJECTED_OPTIONS = ("cache_dir", "cache_report", "state_file")
+
+
+def answer_query(
+    parser: CompatibleArgumentParser, argv: list[str], index: PackageIndex
+) -> dict[str, int | str | None]:
+    """Run the command line `argv` on the packages of the index.
+
+    Returns:
+        The response to the query: the exit code, the output string (None
+        on errors, including the exceptions raised by the command line) and
+        what was written on stdout and stderr otherwise.
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    exit_code: int = 0
+    output_string = None
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            args = parser.parse_args(argv)
+            for name in QUERY_REJECTED_OPTIONS:
+                if getattr(args, name) != parser.get_default(name):
+                    option = "--" + name.replace("_", "-")
+                    parser.error(f"{option} is not allowed in queries")
+            # nor read from the configuration of the server
+            args.cache_dir = args.state_file = None
+            args.cache_report = False
+            # The packages are those of the pythons the server was started
+            # with
+            args.python, args.python_file = [], None
+            args.frozen_distributions = index.distributions()
+            output_string = create_output_string(args)
+            warn_string = create_warn_string(args)
+            if warn_string:
+                print(warn_string, file=sys.stderr)
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+            output_string = None
+        except Exception as e:
+            # the server keeps answering, the client reports the error
+            sys.stderr.write(f"{type(e).__name__}: {e}\n")
+            exit_code = 1
+            output_string = None
+    return {
+        "exit": exit_code,
+        "output": output_string,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+    }
+
+
+# Seconds between two polls of the search paths by the server
+SERVE_POLL_INTERVAL = 1.0
+
+if sys.platform != "win32":
+
+    class QueryServer(socketserver.UnixStreamServer):
+        """Server answering the queries of `--query` on a Unix socket.
+
+        The queries are answered one at a time from a PackageIndex, which
+        is refreshed between the queries.
+        """
+
+        def __init__(
+            self,
+            socket_path: str,
+            index: PackageIndex,
+            parser: CompatibleArgumentParser,
+        ) -> None:
+            super().__init__(socket_path, QueryHandler)
+            self.index = index
+            self.parser = parser
+            self.next_refresh = time.monotonic() + SERVE_POLL_INTERVAL
+
+        def service_actions(self) -> None:
+            if time.monotonic() >= self.next_refresh:
+                self.index.refresh()
+                self.next_refresh = time.monotonic() + SERVE_POLL_INTERVAL
+
+    class QueryHandler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            server = cast(QueryServer, self.server)
+            request = json.loads(self.rfile.readline())
+            response = answer_query(
+                server.parser, request["argv"], server.index
+            )
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+def serve(
+    socket_path: str, search_paths: list[str]
+) -> None:  # pragma: no cover
+    """Answer the queries on the socket `socket_path` until interrupted."""
+    index = PackageIndex(search_paths)
+    # remove the socket left by a previous server
+    with suppress(OSError):
+        if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+
+    # remove the socket on termination too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with QueryServer(socket_path, index, create_parser()) as server:
+        sys.stderr.write(f"serving on {socket_path}\n")
+        try:
+            server.serve_forever(poll_interval=SERVE_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def query_server(socket_path: str, argv: list[str]) -> dict:
+    """Send the command line `argv` to the server listening on
+    `socket_path`, and return its response (see answer_query).
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as sock_file:
+            request = json.dumps({"argv": argv}).encode("utf-8")
+            sock_file.write(request + b"\n")
+            sock_file.flush()
+            return json.loads(sock_file.readline())
+
+
+class PackageCollector:
+    """Select the installed packages and collect their information, as
+    configured by the command-line options.
+
+    The collection is split in three steps: `discover()` the candidate
+    distributions, `collect()` the information of each selected one, and
+    `verify()` it against `--fail-on` and `--allow-only`. `collect()` may
+    run concurrently, in threads or in worker processes.
+    """
+
+    def __init__(
+        self,
+        args: CustomNamespace,
+        output_fields: Iterable[str] | None = None,
+    ) -> None:
+        self.args = args
+        self.included_files = select_included_files(output_fields)
+        self.metadata_keys = select_metadata_keys(output_fields)
+        options = [*self.included_files, *self.metadata_keys]
+        self.cache = (
+            PackageInfoCache(
+                args.cache_dir, args.cache_max_size * 1024 * 1024, options
+            )
+            if args.cache_dir
+            else None
+        )
+        self.state = (
+            PackageInfoState(args.state_file, options)
+            if args.state_file
+            else None
+        )
+
+        self.ignore_pkgs_as_normalize = [
+            normalize_pkg_name_and_version(pkg) for pkg in args.ignore_packages
+        ]
+        self.pkgs_as_normalize = list(deduplicate_and_normalize(args.packages))
+        # The names excluded whatever the version, which can be told from
+        # the name of the .dist-info directory without reading METADATA
+        self.ignore_names = {
+            pkg for pkg in self.ignore_pkgs_as_normalize if ":" not in pkg
+        }
+
+        # The environments each distribution is installed in, when there
+        # are several pythons
+        self.environments: dict[Distribution, list[str]] | None = None
+
+        self.fail_on_licenses = set()
+        if args.fail_on:
+            # filter None types out
+            self.fail_on_licenses = set(
+                filter(None, map(str.strip, args.fail_on.split(";")))
+            )
+
+        self.allow_only_licenses = set()
+        if args.allow_only:
+            # filter None types out
+            self.allow_only_licenses = set(
+                filter(None, map(str.strip, args.allow_only.split(";")))
+            )
+
+    def discover(self) -> Iterator[Distribution]:
+        """Yield the candidate distributions, without the shadowed ones."""
+        args = self.args
+        dists: Iterable[Distribution]
+        if args.frozen_distributions is not None:
+            dists = chain.from_iterable(args.frozen_distributions.values())
+        else:
+            pythons = get_pythons(args)
+            if len(pythons) > 1:
+                return self.discover_environments(pythons)
+            dists = self.discover_python(pythons[0])
+
+        return deduplicate_distributions(
+            dists,
+            self.report_shadowed if args.report_shadowed else None,
+        )
+
+    def discover_environments(
+        self, pythons: list[str]
+    ) -> Iterator[Distribution]:
+        """Discover the candidate distributions of several pythons.
+
+        The distributions installed in several environments, i.e. the same
+        metadata directory found through the search paths of several
+        pythons, are yielded once. Their environments are recorded in
+        `environments`.
+        """
+        self.environments = {}
+        dists: dict[str | Distribution, Distribution] = {}
+        # The pythons are probed (or run the collector) concurrently
+        dists_by_python = map_with_jobs(
+            lambda python: list(self.discover_python(python)),
+            pythons,
+            min(32, len(pythons)),
+        )
+        for python, python_dists in zip(pythons, dists_by_python):
+            for dist in deduplicate_distributions(
+                python_dists,
+                self.report_shadowed if self.args.report_shadowed else None,
+            ):
+                path = get_metadata_path(dist)
+                key = dist if path is None else os.path.realpath(path)
+                dist = dists.setdefault(key, dist)
+                self.environments.setdefault(dist, []).append(python)
+        return iter(dists.values())
+
+    def discover_python(self, python: str) -> Iterable[Distribution]:
+        if self.args.collect_in_target:
+            return collect_in_target(python, bool(self.included_files))
+        return self.discover_search_paths(
+            get_python_search_paths(python, self.cache)
         )
 
-    allow_only_licenses = set()
-    if args.allow_only:
-        # filter None types out
-        allow_only_licenses = set(
-            filter(None, map(str.strip, args.allow_only.split(";")))
+    def discover_search_paths(
+        self, search_paths: list[str]
+    ) -> Iterable[Distribution]:
+        if self.args.snapshots:
+            return chain.from_iterable(
+                map(self.discover_distributions_or_read_snapshot, search_paths)
+            )
+        return self.discover_distributions(search_paths)
+
+    def discover_distributions(
+        self, search_paths: list[str]
+    ) -> Iterator[Distribution]:
+        # With --packages, only the requested distributions are looked up
+        # instead of enumerating the whole environment
+        dists: Iterable[Distribution]
+        if self.args.discovery == DiscoveryArg.SCANDIR:
+            lookup_names = set(self.pkgs_as_normalize) or None
+            dists = scan_distributions(search_paths, lookup_names)
+        else:
+            lookup_names_list = self.pkgs_as_normalize or None
+            dists = find_distributions(search_paths, lookup_names_list)
+        return map(CachedDistribution, dists)
+
+    def discover_distributions_or_read_snapshot(
+        self, search_path: str
+    ) -> Iterable[Distribution]:
+        snapshot = read_snapshot(search_path)
+        if snapshot is not None:
+            return snapshot
+        return self.discover_distributions([search_path])
+
+    def report_shadowed(
+        self, dist: Distribution, shadowed_by: Distribution
+    ) -> None:
+        sys.stderr.write(
+            "distribution {} {} at {} is shadowed by {} at {}\n".format(
+                dist.metadata["name"],
+                dist.version,
+                get_metadata_path(dist),
+                shadowed_by.version,
+                get_metadata_path(shadowed_by),
+            )
         )
 
-    for pkg in pkgs:
-        pkg_name = normalize_pkg_name(pkg.metadata["name"])
-        pkg_version = pkg.metadata["version"]
+    def is_excluded_by_name(self, pkg_name: str) -> bool:
+        return (
+            pkg_name in self.ignore_names
+            or bool(
+                self.pkgs_as_normalize
+                and pkg_name not in self.pkgs_as_normalize
+            )
+            or (not self.args.with_system and pkg_name in SYSTEM_PACKAGES)
+        )
+
+    def collect(self, pkg: Distribution) -> dict[str, str | list[str]] | None:
+        """Return the information of a package, None if not selected."""
+        metadata_path = get_metadata_path(pkg)
+        if metadata_path is not None:
+            dist_info = parse_dist_info_dirname(metadata_path.name)
+            if dist_info is not None and self.is_excluded_by_name(
+                dist_info[0]
+            ):
+                return None
+
+        # The name and version of the snapshots and of the cache hits are not
+        # read from METADATA
+        pkg_info = None
+        cache_entry_path = None
+        state_entry = None
+        if isinstance(pkg, FrozenDistribution):
+            pkg_info = dict(pkg.pkg_info)
+        else:
+            if self.state is not None:
+                state_entry = self.state.get_entry(pkg)
+                if state_entry is not None:
+                    pkg_info = self.state.load(state_entry)
+            if pkg_info is None and self.cache is not None:
+                cache_entry_path = self.cache.get_entry_path(pkg)
+                if cache_entry_path is not None:
+                    pkg_info = self.cache.load(cache_entry_path)
+            if pkg_info is not None:
+                pkg_info = dict(pkg_info)
+        if pkg_info is not None:
+            pkg_name = normalize_pkg_name(cast(str, pkg_info["name"]))
+            pkg_version = pkg_info["version"]
+        else:
+            pkg_name = normalize_pkg_name(pkg.metadata["name"])
+            pkg_version = pkg.metadata["version"]
         pkg_name_and_version = f"{pkg_name}:{pkg_version}"
 
         if (
-            pkg_name.lower() in ignore_pkgs_as_normalize
-            or pkg_name_and_version.lower() in ignore_pkgs_as_normalize
+            pkg_name.lower() in self.ignore_pkgs_as_normalize
+            or pkg_name_and_version.lower() in self.ignore_pkgs_as_normalize
         ):
-            continue
+            return None
 
-        if pkgs_as_normalize and pkg_name.lower() not in pkgs_as_normalize:
-            continue
+        if (
+            self.pkgs_as_normalize
+            and pkg_name.lower() not in self.pkgs_as_normalize
+        ):
+            return None
 
-        if not args.with_system and pkg_name in SYSTEM_PACKAGES:
-            continue
+        if not self.args.with_system and pkg_name in SYSTEM_PACKAGES:
+            return None
 
-        pkg_info = get_pkg_info(pkg)
+        if pkg_info is None:
+            pkg_info = get_pkg_info(
+                pkg, self.included_files, self.metadata_keys
+            )
+            if self.state is not None and state_entry is not None:
+                self.state.store(state_entry, dict(pkg_info))
+            if self.cache is not None and cache_entry_path is not None:
+                self.cache.store(cache_entry_path, pkg_info)
+        return self.filter_pkg_info(pkg_info)
+
+    def filter_pkg_info(
+        self, pkg_info: dict[str, str | list[str]]
+    ) -> dict[str, str | list[str]]:
+        if not self.args.filter_strings:
+            return pkg_info
+
+        code_page = self.args.filter_code_page
+
+        def filter_string(item: str) -> str:
+            return item.encode(code_page, errors="ignore").decode(code_page)
+
+        for k, v in pkg_info.items():
+            if isinstance(v, list):
+                pkg_info[k] = list(map(filter_string, v))
+            else:
+                pkg_info[k] = filter_string(cast(str, v))
+        return pkg_info
 
+    def tag_environments(
+        self, pkg: Distribution, pkg_info: dict[str, str | list[str]]
+    ) -> list[dict[str, str | list[str]]]:
+        """Return the information of a package for each environment it is
+        installed in, when there are several pythons.
+        """
+        if self.environments is None:
+            return [pkg_info]
+        return [
+            {**pkg_info, "environment": environment}
+            for environment in self.environments[pkg]
+        ]
+
+    def verify(self, pkg_info: dict[str, str | list[str]]) -> str | None:
+        """Return the error message if the licenses of a package are not
+        allowed by `--fail-on` or `--allow-only`, None otherwise.
+        """
+        args = self.args
         license_names = select_license_by_source(
             args.from_,
             cast(list[str], pkg_info["license_classifier"]),
@@ -463,86 +1938,273 @@ def get_packages(
             cast(str, pkg_info["license_expression"]),
         )
 
-        if fail_on_licenses:
+        if self.fail_on_licenses:
             failed_licenses = set()
             if not args.partial_match:
                 failed_licenses = case_insensitive_set_intersect(
-                    license_names, fail_on_licenses
+                    license_names, self.fail_on_licenses
                 )
             else:
                 failed_licenses = case_insensitive_partial_match_set_intersect(
-                    license_names, fail_on_licenses
+                    license_names, self.fail_on_licenses
                 )
             if failed_licenses:
-                sys.stderr.write(
-                    "fail-on license {} was found for package {}:{}\n".format(
-                        "; ".join(sorted(failed_licenses)),
+                return "fail-on license {} was found for package {}:{}".format(
+                    "; ".join(sorted(failed_licenses)),
+                    pkg_info["name"],
+                    pkg_info["version"],
+                )
+
+        if self.allow_only_licenses:
+            uncommon_licenses = set()
+            if not args.partial_match:
+                uncommon_licenses = case_insensitive_set_diff(
+                    license_names, self.allow_only_licenses
+                )
+            else:
+                uncommon_licenses = set(
+                    case_insensitive_partial_match_set_diff(
+                        license_names, self.allow_only_licenses
+                    )
+                )
+
+            if len(uncommon_licenses) == len(license_names):
+                return (
+                    "license {} not in allow-only licenses was found"
+                    " for package {}:{}".format(
+                        "; ".join(sorted(uncommon_licenses)),
                         pkg_info["name"],
                         pkg_info["version"],
                     )
                 )
-                sys.exit(1)
+        return None
+
+    def take_changes(self) -> dict:
+        """Return the changes made to the cache and the state by
+        `collect()` since the previous call, to apply them to the collector
+        of the main process with `apply_changes()`.
+        """
+        changes: dict = {}
+        if self.cache is not None:
+            changes["cache_modified"] = self.cache.modified
+            self.cache.modified = False
+        if self.state is not None:
+            changes["state_used"] = self.state.used
+            changes["state_stored"] = {
+                key: self.state.distributions[key] for key in self.state.stored
+            }
+            self.state.used = set()
+            self.state.stored = set()
+        return changes
+
+    def apply_changes(self, changes: dict) -> None:
+        """Apply the changes of the collector of a worker process."""
+        if self.cache is not None and changes["cache_modified"]:
+            self.cache.modified = True
+        if self.state is not None:
+            self.state.used.update(changes["state_used"])
+            for key, stored in changes["state_stored"].items():
+                self.state.store((key, stored["mtime"]), stored["pkg_info"])
+
+    def finish(self) -> None:
+        """Evict the cache and save the state file, once all the packages
+        were collected.
+        """
+        if self.cache is not None:
+            self.cache.evict()
+        if self.state is not None:
+            self.state.save()
+
+
+def get_packages(
+    args: CustomNamespace,
+    output_fields: Iterable[str] | None = None,
+) -> Iterator[dict[str, str | list[str]]]:
+    """Collect the information of the installed packages.
+
+    Args:
+        args: The parsed command-line options.
+        output_fields: The fields that will be output. Only the metadata
+                       and the included files these fields need are
+                       extracted. By default, everything is extracted.
+
+    Yields:
+        The information of each selected package.
+    """
+    collector = PackageCollector(args, output_fields)
+    collected: Iterable[tuple[Distribution, dict[str, str | list[str]] | None]]
+    if args.processes > 1:
+        pkgs = list(collector.discover())
+        pkg_infos = map_with_processes(collector, pkgs, args.processes)
+        collected = zip(pkgs, pkg_infos)
+    else:
+
+        def collect(
+            pkg: Distribution,
+        ) -> tuple[Distribution, dict[str, str | list[str]] | None]:
+            return pkg, collector.collect(pkg)
+
+        collected = map_with_jobs(collect, collector.discover(), args.jobs)
+
+    # The package info is collected by the workers, but verified and yielded
+    # here in discovery order so that the output stays deterministic.
+    for pkg, pkg_info in collected:
+        if pkg_info is None:
+            continue
+
+        error = collector.verify(pkg_info)
+        if error is not None:
+            sys.stderr.write(f"{error}\n")
+            sys.exit(1)
+
+        yield from collector.tag_environments(pkg, pkg_info)
+
+    collector.finish()
+
+
+class LicenseNotAllowedError(Exception):
+    """Raised by aget_packages() when the licenses of a package are not
+    allowed by `--fail-on` or `--allow-only`.
+    """
+
+
+async def aget_packages(
+    args: CustomNamespace,
+    output_fields: Iterable[str] | None = None,
+) -> AsyncIterator[dict[str, str | list[str]]]:
+    """Asynchronous counterpart of get_packages(), for embedding in an
+    asyncio application.
+
+    The blocking file system accesses run on threads, with at most
+    `--jobs` distributions collected at the same time, and the information
+    of each selected package is yielded in discovery order. Closing the
+    iterator, or cancelling the task consuming it, cancels the pending
+    work.
+
+    Raises:
+        LicenseNotAllowedError: The licenses of a package are not allowed
+                                by `--fail-on` or `--allow-only`.
+    """
+    collector = PackageCollector(args, output_fields)
+    pkgs = iter(await asyncio.to_thread(list, collector.discover()))
+    tasks: deque[
+        tuple[Distribution, asyncio.Future[dict[str, str | list[str]] | None]]
+    ] = deque()
+
+    def schedule(count: int) -> None:
+        for pkg in islice(pkgs, count):
+            task = asyncio.ensure_future(
+                asyncio.to_thread(collector.collect, pkg)
+            )
+            tasks.append((pkg, task))
+
+    schedule(args.jobs)
+    try:
+        while tasks:
+            pkg, task = tasks[0]
+            pkg_info = await task
+            tasks.popleft()
+            schedule(1)
+            if pkg_info is None:
+                continue
+
+            error = collector.verify(pkg_info)
+            if error is not None:
+                raise LicenseNotAllowedError(error)
+
+            for tagged_pkg_info in collector.tag_environments(pkg, pkg_info):
+                yield tagged_pkg_info
+    finally:
+        for _, task in tasks:
+            task.cancel()
+
+    await asyncio.to_thread(collector.finish)
+
+
+def get_default_jobs() -> int:
+    """Return the default number of `--jobs` worker threads.
+
+    On the free-threaded builds of Python, the worker threads run in
+    parallel: collect with one thread per CPU. Otherwise the threads only
+    overlap their I/O, so collect without them.
+    """
+    if getattr(sys, "_is_gil_enabled", lambda: True)():
+        return 1
+    return min(32, os.cpu_count() or 1)
+
 
-        if allow_only_licenses:
-            uncommon_licenses = set()
-            if not args.partial_match:
-                uncommon_licenses = case_insensitive_set_diff(
-                    license_names, allow_only_licenses
-                )
-            else:
-                uncommon_licenses = set(
-                    case_insensitive_partial_match_set_diff(
-                        license_names, allow_only_licenses
-                    )
-                )
+def map_with_jobs(
+    func: Callable[[_T], _R], iterable: Iterable[_T], jobs: int
+) -> Generator[_R, None, None]:
+    """Same as map() but runs `func` on a pool of `jobs` worker threads.
 
-            if len(uncommon_licenses) == len(license_names):
-                sys.stderr.write(
-                    "license {} not in allow-only licenses was found"
-                    " for package {}:{}\n".format(
-                        "; ".join(sorted(uncommon_licenses)),
-                        pkg_info["name"],
-                        pkg_info["version"],
-                    )
-                )
-                sys.exit(1)
+    Results are yielded in the order of `iterable` regardless of the order
+    in which the workers finish. At most `2 * jobs` items are submitted
+    ahead of the consumer, so that the results waiting to be consumed stay
+    bounded. Pending work is cancelled when the consumer stops iterating
+    (e.g. on the first `--fail-on` match).
+    """
+    if jobs <= 1:
+        yield from map(func, iterable)
+        return
 
-        yield pkg_info
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    items = iter(iterable)
+    try:
+        futures: deque[Future[_R]] = deque(
+            executor.submit(func, item) for item in islice(items, 2 * jobs)
+        )
+        while futures:
+            result = futures.popleft().result()
+            futures.extend(
+                executor.submit(func, item) for item in islice(items, 1)
+            )
+            yield result
+    finally:
+        executor.shutdown(cancel_futures=True)
 
 
 def create_licenses_table(
     args: CustomNamespace,
     output_fields: set[str] | Sequence[str] = DEFAULT_OUTPUT_FIELDS,
-) -> PrettyTable:
+) -> PrettyTable | RowTable:
     table = factory_styled_table_with_args(args, output_fields)
 
-    for pkg in get_packages(args):
-        row = []
-        for field in output_fields:
-            if field == "License":
-                license_set = select_license_by_source(
-                    args.from_,
-                    cast(list[str], pkg["license_classifier"]),
-                    cast(str, pkg["license"]),
-                    cast(str, pkg["license_expression"]),
-                )
-                license_str = "; ".join(sorted(license_set))
-                row.append(license_str)
-            elif field == "License-Classifier":
-                row.append(
-                    "; ".join(sorted(pkg["license_classifier"]))
-                    or LICENSE_UNKNOWN
-                )
-            elif field.lower() in pkg:
-                row.append(cast(str, pkg[field.lower()]))
-            else:
-                row.append(cast(str, pkg[FIELDS_TO_METADATA_KEYS[field]]))
-        table.add_row(row)
+    for pkg in get_packages(args, output_fields):
+        table.add_row(get_output_row(args, output_fields, pkg))
 
     return table
 
 
-def create_summary_table(args: CustomNamespace) -> PrettyTable:
+def get_output_row(
+    args: CustomNamespace,
+    output_fields: Iterable[str],
+    pkg: dict[str, str | list[str]],
+) -> list[str]:
+    """Return the row of the licenses table of a package."""
+    row = []
+    for field in output_fields:
+        if field == "License":
+            license_set = select_license_by_source(
+                args.from_,
+                cast(list[str], pkg["license_classifier"]),
+                cast(str, pkg["license"]),
+                cast(str, pkg["license_expression"]),
+            )
+            license_str = "; ".join(sorted(license_set))
+            row.append(license_str)
+        elif field == "License-Classifier":
+            row.append(
+                "; ".join(sorted(pkg["license_classifier"])) or LICENSE_UNKNOWN
+            )
+        elif field.lower() in pkg:
+            row.append(cast(str, pkg[field.lower()]))
+        else:
+            row.append(cast(str, pkg[FIELDS_TO_METADATA_KEYS[field]]))
+    return row
+
+
+def create_summary_table(args: CustomNamespace) -> PrettyTable | RowTable:
     counts = Counter(
         "; ".join(
             sorted(
@@ -554,7 +2216,7 @@ def create_summary_table(args: CustomNamespace) -> PrettyTable:
                 )
             )
         )
-        for pkg in get_packages(args)
+        for pkg in get_packages(args, SUMMARY_FIELD_NAMES)
     )
 
     table = factory_styled_table_with_args(args, SUMMARY_FIELD_NAMES)
@@ -619,112 +2281,198 @@ def case_insensitive_set_diff(
     return uncommon_items
 
 
-class JsonPrettyTable(PrettyTable):
-    """PrettyTable-like class exporting to JSON"""
+def get_table_rows(
+    field_names: list[str],
+    rows: list[list],
+    fields: Collection[str] | None = None,
+    sortby: str | None = None,
+) -> list[list]:
+    """Return the rows sorted by the `sortby` field, then by all the fields,
+    with only the columns of `fields` in the table order, as PrettyTable
+    does.
+    """
+    if sortby:
+        index = field_names.index(sortby)
+        rows = sorted(rows, key=lambda row: [row[index], *row])
+    if fields:
+        indexes = [
+            index for index, field in enumerate(field_names) if field in fields
+        ]
+        rows = [[row[index] for index in indexes] for row in rows]
+    return rows
+
+
+class RowTable(ABC):
+    """Minimal table of the machine-readable formats.
+
+    Only stores the rows, and sorts and projects them like PrettyTable
+    does: the rendering of the rows is left to `iter_chunks()`, which
+    writes the chunks of the output string of the format.
+    """
 
-    def format_row(self, row: RowType) -> dict[str, str | list[str]]:
-        return dict(zip(self._field_names, row))
+    def __init__(self, field_names: Iterable[str]) -> None:
+        self.field_names = list(field_names)
+        self.rows: list[list] = []
 
-    def get_string(self, **kwargs: str | list[str]) -> str:
-        # import included here in order to limit dependencies
-        # if not interested in JSON output,
-        # then the dependency is not required
-        import json
+    def add_row(self, row: Iterable) -> None:
+        self.rows.append(list(row))
 
-        options = self._get_options(kwargs)
-        rows = self._get_rows(options)
-        lines = [self.format_row(row) for row in rows]
-        return json.dumps(lines, indent=2, sort_keys=True)
+    def get_rows(
+        self,
+        fields: Collection[str] | None = None,
+        sortby: str | None = None,
+    ) -> list[list]:
+        """Return the rows sorted and projected, see get_table_rows()."""
+        return get_table_rows(self.field_names, self.rows, fields, sortby)
 
+    def get_string(
+        self,
+        fields: Collection[str] | None = None,
+        sortby: str | None = None,
+    ) -> str:
+        field_names = [
+            field
+            for field in self.field_names
+            if not fields or field in fields
+        ]
+        return "".join(
+            self.iter_chunks(field_names, self.get_rows(fields, sortby))
+        )
 
-class JsonLicenseFinderTable(JsonPrettyTable):
-    def format_row(self, row: RowType) -> dict[str, str | list[str]]:
-        resrow: dict[str, str | list[str]] = {}
-        for field, value in zip(self._field_names, row):
-            if field == "Name":
-                resrow["name"] = value
+    def __str__(self) -> str:
+        return self.get_string()
 
-            if field == "Version":
-                resrow["version"] = value
+    @staticmethod
+    @abstractmethod
+    def iter_chunks(
+        field_names: list[str], rows: Iterable[list]
+    ) -> Iterator[str]:
+        """Render the rows of the table, in chunks of the output string."""
 
-            if field == "License":
-                resrow["licenses"] = [value]
 
-        return resrow
+class JsonPrettyTable(RowTable):
+    """PrettyTable-like class exporting to JSON"""
 
-    def get_string(self, **kwargs: str | list[str]) -> str:
-        # import included here in order to limit dependencies
-        # if not interested in JSON output,
-        # then the dependency is not required
-        import json
+    @staticmethod
+    def iter_chunks(
+        field_names: list[str], rows: Iterable[list]
+    ) -> Iterator[str]:
+        separator = "[\n"
+        for row in rows:
+            line = json.dumps(
+                dict(zip(field_names, row)), indent=2, sort_keys=True
+            )
+            yield separator + textwrap.indent(line, "  ")
+            separator = ",\n"
+        yield "[]" if separator == "[\n" else "\n]"
 
-        options = self._get_options(kwargs)
-        rows = self._get_rows(options)
-        lines = [self.format_row(row) for row in rows]
-        return json.dumps(lines, sort_keys=True)
 
+class JsonLicenseFinderTable(RowTable):
+    """PrettyTable-like class exporting to the JSON of LicenseFinder"""
 
-class CSVPrettyTable(PrettyTable):
-    """PrettyTable-like class exporting to CSV"""
+    @staticmethod
+    def iter_chunks(
+        field_names: list[str], rows: Iterable[list]
+    ) -> Iterator[str]:
+        separator = "["
+        for row in rows:
+            resrow: dict[str, str | list[str]] = {}
+            for field, value in zip(field_names, row):
+                if field == "Name":
+                    resrow["name"] = value
 
-    def get_string(self, **kwargs: str | list[str]) -> str:
-        def esc_quotes(val: bytes | str) -> str:
-            """
-            Meta-escaping double quotes
-            https://tools.ietf.org/html/rfc4180
-            """
-            try:
-                return cast(str, val).replace('"', '""')
-            except UnicodeDecodeError:  # pragma: no cover
-                return cast(bytes, val).decode("utf-8").replace('"', '""')
-            except UnicodeEncodeError:  # pragma: no cover
-                return str(
-                    cast(str, val).encode("unicode_escape").replace('"', '""')  # type: ignore[arg-type]
-                )
+                if field == "Version":
+                    resrow["version"] = value
 
-        options = self._get_options(kwargs)
-        rows = self._get_rows(options)
-        formatted_rows = self._format_rows(rows)
+                if field == "License":
+                    resrow["licenses"] = [value]
+            yield separator + json.dumps(resrow, sort_keys=True)
+            separator = ", "
+        yield "[]" if separator == "[" else "]"
+
+
+class JsonLinesPrettyTable(RowTable):
+    """PrettyTable-like class exporting to JSON Lines, one JSON object per
+    line terminated by a newline.
+    """
+
+    @staticmethod
+    def iter_chunks(
+        field_names: list[str], rows: Iterable[list]
+    ) -> Iterator[str]:
+        for row in rows:
+            yield (
+                json.dumps(dict(zip(field_names, row)), sort_keys=True) + "\n"
+            )
 
-        lines: list[str] = []
-        formatted_header = ",".join(
-            [f'"{esc_quotes(val)}"' for val in self._field_names]
-        )
-        lines.append(formatted_header)
-        lines.extend(
-            [
-                ",".join([f'"{esc_quotes(val)}"' for val in row])
-                for row in formatted_rows
-            ]
-        )
 
-        return "\n".join(lines)
+def format_csv_row(row: Iterable) -> str:
+    """Format a CSV record, all the values quoted, without line terminator.
 
+    See https://tools.ietf.org/html/rfc4180
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="").writerow(row)
+    return buffer.getvalue()
+
+
+class CSVPrettyTable(RowTable):
+    """PrettyTable-like class exporting to CSV"""
+
+    @staticmethod
+    def iter_chunks(
+        field_names: list[str], rows: Iterable[list]
+    ) -> Iterator[str]:
+        yield format_csv_row(field_names)
+        for row in rows:
+            yield "\n" + format_csv_row(row)
 
-class PlainVerticalTable(PrettyTable):
-    """PrettyTable for outputting to a simple non-column based style.
+
+class PlainVerticalTable(RowTable):
+    """PrettyTable-like class for outputting to a simple non-column based
+    style.
 
     When used with --with-license-file, this style is similar to the default
     style generated from Angular CLI's --extractLicenses flag.
     """
 
-    def get_string(self, **kwargs: str | list[str]) -> str:
-        options = self._get_options(kwargs)
-        rows = self._get_rows(options)
-
-        output = ""
+    @staticmethod
+    def iter_chunks(
+        field_names: list[str], rows: Iterable[list]
+    ) -> Iterator[str]:
         for row in rows:
-            for v in row:
-                output += f"{v}\n"
-            output += "\n"
+            yield "".join(f"{value}\n" for value in row) + "\n"
 
-        return output
+
+def get_row_table_class(format_: FormatArg) -> type[RowTable] | None:
+    """Return the RowTable of a machine-readable format, None for the
+    formats rendered by PrettyTable.
+    """
+    if format_ == FormatArg.JSON:
+        return JsonPrettyTable
+    elif format_ == FormatArg.JSON_LICENSE_FINDER:
+        return JsonLicenseFinderTable
+    elif format_ == FormatArg.JSON_LINES:
+        return JsonLinesPrettyTable
+    elif format_ == FormatArg.CSV:
+        return CSVPrettyTable
+    elif format_ == FormatArg.PLAIN_VERTICAL:
+        return PlainVerticalTable
+    return None
 
 
 def factory_styled_table_with_args(
     args: CustomNamespace,
     output_fields: set[str] | Sequence[str] = DEFAULT_OUTPUT_FIELDS,
-) -> PrettyTable:
+) -> PrettyTable | RowTable:
+    row_table_class = get_row_table_class(args.format_)
+    if row_table_class is not None:
+        return row_table_class(output_fields)
+
+    # import included here in order to limit dependencies
+    # if only interested in machine-readable formats
+    from prettytable import HRuleStyle, PrettyTable
+
     table = PrettyTable()
     table.field_names = output_fields  # type: ignore[assignment]
     table.align = "l"  # type: ignore[assignment]
@@ -732,7 +2480,6 @@ def factory_styled_table_with_args(
         FormatArg.MARKDOWN,
         FormatArg.RST,
         FormatArg.CONFLUENCE,
-        FormatArg.JSON,
     )
     table.header = True
 
@@ -745,14 +2492,6 @@ def factory_styled_table_with_args(
     elif args.format_ == FormatArg.CONFLUENCE:
         table.junction_char = "|"
         table.hrules = HRuleStyle.NONE
-    elif args.format_ == FormatArg.JSON:
-        table = JsonPrettyTable(table.field_names)
-    elif args.format_ == FormatArg.JSON_LICENSE_FINDER:
-        table = JsonLicenseFinderTable(table.field_names)
-    elif args.format_ == FormatArg.CSV:
-        table = CSVPrettyTable(table.field_names)
-    elif args.format_ == FormatArg.PLAIN_VERTICAL:
-        table = PlainVerticalTable(table.field_names)
 
     return table
 
@@ -817,6 +2556,9 @@ def get_output_fields(args: CustomNamespace) -> list[str]:
     if args.no_version:
         output_fields.remove("Version")
 
+    if len(get_pythons(args)) > 1:
+        output_fields.append("Environment")
+
     if args.with_license_file:
         if not args.no_license_path:
             output_fields.append("LicenseFile")
@@ -831,7 +2573,7 @@ def get_output_fields(args: CustomNamespace) -> list[str]:
     return output_fields
 
 
-def get_sortby(args: CustomNamespace) -> str:
+def get_sortby(args: CustomNamespace) -> str | None:
     if args.summary and args.order == OrderArg.COUNT:
         return "Count"
     elif args.summary or args.order == OrderArg.LICENSE:
@@ -844,11 +2586,36 @@ def get_sortby(args: CustomNamespace) -> str:
         return "Maintainer"
     elif args.order == OrderArg.URL and args.with_urls:
         return "URL"
+    elif args.order == OrderArg.NONE:
+        return None
 
     return "Name"
 
 
 def create_output_string(args: CustomNamespace) -> str:
+    if not (args.cache_report and args.cache_dir):
+        return render_output_string(args)
+
+    # The whole report is reused while the environment and the options are
+    # unchanged. It is only stored once the verify options passed.
+    cache = PackageInfoCache(
+        args.cache_dir, args.cache_max_size * 1024 * 1024, []
+    )
+    entry_path = cache.get_report_path(get_environment_fingerprint(args))
+    report = cache.load(entry_path)
+    if report is not None:
+        return cast(str, report["output"])
+
+    output_string = render_output_string(args)
+    cache.store(entry_path, {"output": output_string})
+    cache.evict()
+    return output_string
+
+
+def render_output_string(args: CustomNamespace) -> str:
+    if can_stream_output(args):
+        return "".join(iter_output_chunks(args))
+
     output_fields = get_output_fields(args)
 
     if args.summary:
@@ -858,18 +2625,402 @@ def create_output_string(args: CustomNamespace) -> str:
 
     sortby = get_sortby(args)
 
-    if args.format_ == FormatArg.HTML:
+    if isinstance(table, RowTable):
+        return table.get_string(fields=output_fields, sortby=sortby)
+    elif args.format_ == FormatArg.HTML:
         html = table.get_html_string(fields=output_fields, sortby=sortby)
         return html.encode("ascii", errors="xmlcharrefreplace").decode("ascii")
     else:
-        return table.get_string(fields=output_fields, sortby=sortby)
+        return render_text_table(
+            table,
+            output_fields,
+            sortby,
+            args.max_cell_width,
+            args.cell_overflow == CellOverflowArg.TRUNCATE,
+        )
+
+
+# The terminal styles of the text, which take no column
+PATTERN_ANSI_ESCAPE = re.compile(r"\033\[[0-9;]*m|\033\(B")
+
+
+def get_display_width(line: str) -> int:
+    """Return the number of terminal columns taken by a line of text."""
+    if line.isascii() and line.isprintable():
+        return len(line)
+
+    # import included here in order to limit dependencies
+    # if only interested in machine-readable formats
+    import wcwidth
+
+    line = PATTERN_ANSI_ESCAPE.sub("", line)
+    width = wcwidth.wcswidth(line)
+    if width < 0:
+        # control characters take no column
+        width = sum(max(wcwidth.wcwidth(char), 0) for char in line)
+    return width
+
+
+def get_cell_width(
+    value: str, display_width: Callable[[str], int] = get_display_width
+) -> int:
+    """Return the width of the widest line of a table cell."""
+    return max(display_width(line) for line in value.split("\n"))
+
+
+def fit_line(line: str, width: int, truncate: bool) -> tuple[str, ...]:
+    """Split a line of text into lines of at most `width` columns, or keep
+    the first of them if `truncate`.
+    """
+    if line.isascii() and line.isprintable():
+        if truncate:
+            return (line[:width],)
+        return tuple(textwrap.wrap(line, width)) or ("",)
+
+    # keep the zero-width characters with the preceding character
+    clusters: list[str] = []
+    for char in line:
+        if clusters and get_display_width(char) == 0:
+            clusters[-1] += char
+        else:
+            clusters.append(char)
+    parts = [""]
+    for cluster in clusters:
+        if parts[-1] and get_display_width(parts[-1] + cluster) > width:
+            if truncate:
+                break
+            parts.append("")
+        parts[-1] += cluster
+    return tuple(parts)
+
+
+def fit_cell(
+    value: str,
+    width: int,
+    truncate: bool,
+    display_width: Callable[[str], int] = get_display_width,
+    fit: Callable[[str, int, bool], tuple[str, ...]] = fit_line,
+) -> str:
+    """Wrap or truncate the lines of a table cell wider than `width`.
+
+    `display_width` and `fit` may be cached versions of
+    get_display_width() and fit_line().
+    """
+    lines: list[str] = []
+    for line in value.split("\n"):
+        if display_width(line) <= width:
+            lines.append(line)
+        else:
+            lines.extend(fit(line, width, truncate))
+    return "\n".join(lines)
+
+
+def render_text_table(
+    table: PrettyTable,
+    fields: Collection[str],
+    sortby: str | None,
+    max_cell_width: int = 0,
+    truncate: bool = False,
+) -> str:
+    """Same output as PrettyTable.get_string() for the left-aligned tables
+    of factory_styled_table_with_args().
+
+    The widths of the lines are computed by get_display_width(), which
+    skips the Unicode lookups of the ASCII lines. The widths and the fitted
+    lines are cached for this call only, so the lines repeated across the
+    license texts are measured once without holding them once rendered
+    (e.g. in the `--serve` process).
+
+    Args:
+        table: The table of the plain, markdown, rst or confluence format.
+        fields: The fields to output, in the order of the table.
+        sortby: The field to sort the rows by, then by all the fields.
+        max_cell_width: The maximum width of the cells, 0 for no limit.
+        truncate: Truncate the cells wider than `max_cell_width` instead
+            of wrapping them.
+    """
+    from prettytable import HRuleStyle
+
+    field_names = [field for field in table.field_names if field in fields]
+    cells = [
+        [str(value).expandtabs() for value in row]
+        for row in get_table_rows(
+            table.field_names, table.rows, fields, sortby
+        )
+    ]
+    if not cells and not table.border:
+        return ""
+    display_width = lru_cache(maxsize=None)(get_display_width)
+    if max_cell_width > 0:
+        fit = lru_cache(maxsize=None)(fit_line)
+        cells = [
+            [
+                fit_cell(value, max_cell_width, truncate, display_width, fit)
+                for value in row
+            ]
+            for row in cells
+        ]
+
+    widths = [get_cell_width(field, display_width) for field in field_names]
+    for row in cells:
+        widths = [
+            max(width, get_cell_width(value, display_width))
+            for width, value in zip(widths, row)
+        ]
+
+    padding = " " * table.padding_width
+    hrule = ""
+    if table.border:
+        junction = table.junction_char
+        hrule = (
+            junction
+            + junction.join(
+                table.horizontal_char * (width + 2 * table.padding_width)
+                for width in widths
+            )
+            + junction
+        )
+
+    def render_row(row: list[str]) -> str:
+        columns = [
+            [
+                padding + line + " " * (width - display_width(line)) + padding
+                for line in value.split("\n")
+            ]
+            for value, width in zip(row, widths)
+        ]
+        height = max(len(column) for column in columns)
+        for column, width in zip(columns, widths):
+            column += [padding + " " * width + padding] * (
+                height - len(column)
+            )
+        if table.border:
+            vertical = table.vertical_char
+            return "\n".join(
+                vertical + vertical.join(bits) + vertical
+                for bits in zip(*columns)
+            )
+        return "\n".join("".join(bits) for bits in zip(*columns))
+
+    lines = []
+    if table.border and table.hrules in (HRuleStyle.ALL, HRuleStyle.FRAME):
+        lines.append(hrule)
+    lines.append(render_row(field_names))
+    if table.border and table.hrules != HRuleStyle.NONE:
+        lines.append(hrule)
+    for row in cells:
+        lines.append(render_row(row))
+        if table.border and table.hrules == HRuleStyle.ALL:
+            lines.append(hrule)
+    if table.border and table.hrules == HRuleStyle.FRAME:
+        lines.append(hrule)
+    return "\n".join(lines)
+
+
+# Fields too large to be held in memory for sorting
+UNSORTED_FIELDS = ("LicenseText", "NoticeText")
+
+
+def can_stream_output(args: CustomNamespace) -> bool:
+    """Whether the output can be rendered by iter_output_chunks()."""
+    return not args.summary and (
+        get_row_table_class(args.format_) is not None
+        or args.format_ == FormatArg.HTML
+    )
+
+
+def iter_output_chunks(args: CustomNamespace) -> Iterator[str]:
+    """Render the licenses table in chunks, as the packages are collected.
+
+    Unlike create_licenses_table(), the rows are not held in memory: with
+    `--order=none`, each row is rendered as soon as its package is
+    collected. Otherwise the rows are spilled to a temporary file, and only
+    their sort keys are held in memory.
+
+    Args:
+        args: The parsed command-line options, see can_stream_output().
+
+    Yields:
+        The chunks of the output string.
+    """
+    output_fields = get_output_fields(args)
+    rows: Iterable[list[str]] = (
+        get_output_row(args, output_fields, pkg)
+        for pkg in get_packages(args, output_fields)
+    )
+    sortby = get_sortby(args)
+    if sortby is not None:
+        rows = sort_rows_on_disk(rows, output_fields, sortby)
+
+    # Nothing is rendered, not even the header, before the first row: when
+    # sorted, all the packages are checked by `--fail-on` and
+    # `--allow-only` before any output
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is not None:
+        rows = chain([first_row], rows)
+
+    row_table_class = get_row_table_class(args.format_)
+    if row_table_class is not None:
+        yield from row_table_class.iter_chunks(output_fields, rows)
+    else:
+        yield from iter_html_chunks(output_fields, rows)
+
+
+# Number of sort keys sort_rows_on_disk() holds in memory, beyond which
+# they are sorted in runs spilled to temporary files
+SORT_RUN_SIZE = 50_000
+
+
+def sort_rows_on_disk(
+    rows: Iterable[list[str]], output_fields: list[str], sortby: str
+) -> Iterator[list[str]]:
+    """Sort the rows as PrettyTable does, by the `sortby` field then by the
+    other fields, with an external merge sort.
+
+    The rows are spilled to a temporary file, and only their (sort key,
+    offset) tuples are sorted. Beyond SORT_RUN_SIZE rows, the tuples are
+    sorted in runs spilled to temporary files as well, then merged. The
+    rows tied on all the fields but UNSORTED_FIELDS keep their order.
+    """
+    key_indexes = [output_fields.index(sortby)]
+    key_indexes += [
+        index
+        for index, field in enumerate(output_fields)
+        if field not in UNSORTED_FIELDS
+    ]
+    with ExitStack() as stack:
+        spill_file = stack.enter_context(tempfile.TemporaryFile())
+        runs: list[Iterator[tuple[tuple[str, ...], int]]] = []
+        keys: list[tuple[tuple[str, ...], int]] = []
+        offset = 0
+        for row in rows:
+            line = json.dumps(row).encode("utf-8") + b"\n"
+            spill_file.write(line)
+            keys.append((tuple(row[index] for index in key_indexes), offset))
+            offset += len(line)
+            if len(keys) == SORT_RUN_SIZE:
+                run_file = stack.enter_context(tempfile.TemporaryFile())
+                runs.append(spill_sorted_run(keys, run_file))
+                keys = []
+
+        keys.sort()
+        for _, offset in heapq.merge(keys, *runs):
+            spill_file.seek(offset)
+            yield json.loads(spill_file.readline())
+
+
+def spill_sorted_run(
+    keys: list[tuple[tuple[str, ...], int]], run_file: IO[bytes]
+) -> Iterator[tuple[tuple[str, ...], int]]:
+    """Write the sorted keys to a run file, and return an iterator reading
+    them back.
+    """
+    keys.sort()
+    for key in keys:
+        run_file.write(json.dumps(key).encode("utf-8") + b"\n")
+    run_file.seek(0)
+    return (
+        (tuple(sort_key), offset)
+        for sort_key, offset in map(json.loads, run_file)
+    )
+
+
+def iter_html_chunks(
+    output_fields: list[str], rows: Iterable[list[str]]
+) -> Iterator[str]:
+    """Same output as PrettyTable.get_html_string(), with the non-ASCII
+    characters escaped, in chunks.
+    """
+
+    def html_cell(tag: str, value: str) -> str:
+        value = html.escape(value).replace("\n", "<br>")
+        return f"            <{tag}>{value}</{tag}>\n"
+
+    lines = ["<table>\n", "    <thead>\n", "        <tr>\n"]
+    lines += [html_cell("th", field) for field in output_fields]
+    lines += ["        </tr>\n", "    </thead>\n", "    <tbody>\n"]
+    yield "".join(lines)
+    for row in rows:
+        lines = ["        <tr>\n"]
+        lines += [html_cell("td", value.expandtabs()) for value in row]
+        lines.append("        </tr>\n")
+        chunk = "".join(lines)
+        yield chunk.encode("ascii", errors="xmlcharrefreplace").decode("ascii")
+    yield "    </tbody>\n</table>"
+
+
+def write_streamed_output(args: CustomNamespace) -> None:
+    """Write the output to `--output-file` or to stdout as it is rendered,
+    see iter_output_chunks().
+
+    The output file is written to a temporary file next to it, which
+    replaces it once complete: a run stopped by `--fail-on`, `--allow-only`
+    or an error leaves the previous output file untouched.
+    """
+    if args.output_file is None:
+        for chunk in iter_output_chunks(args):
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+        sys.stdout.write(get_output_end(args))
+        return
+
+    def exit_on_output_file_error() -> NoReturn:
+        sys.stderr.write("check path: --output-file\n")
+        sys.exit(1)
+
+    output_path = Path(args.output_file)
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    try:
+        f = open(tmp_path, "w", encoding="utf-8")
+    except OSError:
+        exit_on_output_file_error()
+
+    def write(text: str) -> None:
+        try:
+            f.write(text)
+            f.flush()
+        except OSError:
+            exit_on_output_file_error()
+
+    try:
+        with f:
+            chunk = ""
+            # the errors of the collection of the packages are not about
+            # the output file, they are raised as is
+            for chunk in iter_output_chunks(args):
+                write(chunk)
+            if not chunk.endswith("\n"):
+                # Always end output files with a new line
+                write("\n")
+        try:
+            os.replace(tmp_path, output_path)
+        except OSError:
+            exit_on_output_file_error()
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+    sys.stdout.write(f"created path: {args.output_file}\n")
+    sys.exit(0)
+
+
+def get_output_end(args: CustomNamespace) -> str:
+    """Return the string printed after the output string: a newline, but
+    for JSON Lines whose records already end with one.
+    """
+    return "" if args.format_ == FormatArg.JSON_LINES else "\n"
 
 
 def create_warn_string(args: CustomNamespace) -> str:
     warn_messages = []
     warn = partial(output_colored, "33")
 
-    if args.with_license_file and args.format_ != FormatArg.JSON:
+    if args.with_license_file and args.format_ not in (
+        FormatArg.JSON,
+        FormatArg.JSON_LINES,
+    ):
         message = warn(
             "Due to the length of these fields, this option is "
             "best paired with --format=json."
@@ -934,7 +3085,85 @@ class CustomHelpFormatter(argparse.HelpFormatter):  # pragma: no cover
         return super()._split_lines(text, width)
 
 
+# The collector of a worker process of map_with_processes()
+worker_collector: PackageCollector | None = None
+
+
+def init_worker_process(
+    collector: PackageCollector,
+) -> None:  # pragma: no cover
+    global worker_collector
+    worker_collector = collector
+
+
+def collect_in_worker_process(
+    metadata_paths: list[str],
+) -> tuple[list[dict[str, str | list[str]] | None], dict]:  # pragma: no cover
+    """Collect the information of the distributions of a shard.
+
+    Returns:
+        The information of each distribution (None if not selected), and
+        the changes made to the cache and the state file.
+    """
+    collector = cast(PackageCollector, worker_collector)
+    pkgs = (
+        CachedDistribution(importlib_metadata.PathDistribution(Path(path)))
+        for path in metadata_paths
+    )
+    pkg_infos = list(
+        map_with_jobs(collector.collect, pkgs, collector.args.jobs)
+    )
+    return pkg_infos, collector.take_changes()
+
+
+def map_with_processes(
+    collector: PackageCollector, pkgs: Iterable[Distribution], processes: int
+) -> Generator[dict[str, str | list[str]] | None, None, None]:
+    """Same as map(collector.collect, pkgs) but runs on a pool of
+    `processes` worker processes.
+
+    The distributions are sharded in contiguous chunks of metadata
+    directories, and the results are yielded in the order of `pkgs`. The
+    distributions which have no metadata directory on disk (or come from a
+    snapshot) are collected in the current process.
+    """
+    pkgs = list(pkgs)
+    chunk_size = max(1, -(-len(pkgs) // (processes * 4)))
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=init_worker_process,
+        initargs=(collector,),
+    )
+    try:
+        tasks: list[Future | Distribution] = []
+        chunk: list[str] = []
+        for pkg in pkgs:
+            path = pkg.path if isinstance(pkg, CachedDistribution) else None
+            if path is not None:
+                chunk.append(str(path))
+            if chunk and (path is None or len(chunk) == chunk_size):
+                tasks.append(executor.submit(collect_in_worker_process, chunk))
+                chunk = []
+            if path is None:
+                tasks.append(pkg)
+        if chunk:
+            tasks.append(executor.submit(collect_in_worker_process, chunk))
+
+        for task in tasks:
+            if isinstance(task, Future):
+                pkg_infos, changes = task.result()
+                collector.apply_changes(changes)
+                yield from pkg_infos
+            else:
+                yield collector.collect(task)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
 class CustomNamespace(argparse.Namespace):
+    python: list[str] | str
+    python_file: str | None
+    collect_in_target: bool
     from_: FromArg
     order: OrderArg
     format_: FormatArg
@@ -942,6 +3171,21 @@ class CustomNamespace(argparse.Namespace):
     output_file: str
     ignore_packages: list[str]
     packages: list[str]
+    jobs: int
+    processes: int
+    discovery: DiscoveryArg
+    report_shadowed: bool
+    cache_dir: str | None
+    cache_max_size: int
+    cache_report: bool
+    fingerprint: bool
+    snapshots: bool
+    write_snapshot: list[str] | None
+    state_file: str | None
+    serve: str | None
+    query: str | None
+    # set by the server to answer the queries from its index
+    frozen_distributions: dict[str, list[FrozenDistribution]] | None
     with_system: bool
     with_authors: bool
     with_urls: bool
@@ -951,6 +3195,8 @@ class CustomNamespace(argparse.Namespace):
     with_notice_file: bool
     filter_strings: bool
     filter_code_page: str
+    max_cell_width: int
+    cell_overflow: CellOverflowArg
     partial_match: bool
     fail_on: str | None
     allow_only: str | None
@@ -979,6 +3225,22 @@ class CompatibleArgumentParser(argparse.ArgumentParser):
                 "'--filter-code-page' requires the '--filter-strings' "
                 "option to be set"
             )
+        if args.jobs < 1:
+            self.error("'--jobs' requires a positive number of workers")
+        if args.processes < 1:
+            self.error("'--processes' requires a positive number of workers")
+        if args.max_cell_width < 0:
+            self.error("'--max-cell-width' requires a positive width or 0")
+        if args.cache_max_size < 1:
+            self.error("'--cache-max-size' requires a positive size")
+        if args.cache_report and not args.cache_dir:
+            self.error(
+                "'--cache-report' requires the '--cache-dir' option to be set"
+            )
+        if args.serve and args.query:
+            self.error("'--serve' and '--query' cannot be used together")
+        if (args.serve or args.query) and sys.platform == "win32":
+            self.error("'--serve' and '--query' require Unix domain sockets")
         try:
             codecs.lookup(args.filter_code_page)
         except LookupError:
@@ -1010,6 +3272,7 @@ class OrderArg(NoValueEnum):
     AUTHOR = A = auto()
     MAINTAINER = M = auto()
     URL = U = auto()
+    NONE = auto()
 
 
 class FormatArg(NoValueEnum):
@@ -1021,9 +3284,20 @@ class FormatArg(NoValueEnum):
     HTML = H = auto()
     JSON = J = auto()
     JSON_LICENSE_FINDER = JLF = auto()
+    JSON_LINES = JSONL = NDJSON = auto()
     CSV = auto()
 
 
+class CellOverflowArg(NoValueEnum):
+    WRAP = auto()
+    TRUNCATE = auto()
+
+
+class DiscoveryArg(NoValueEnum):
+    IMPORTLIB = auto()
+    SCANDIR = auto()
+
+
 def value_to_enum_key(value: str) -> str:
     return value.replace("-", "_").upper()
 
@@ -1046,6 +3320,8 @@ MAP_DEST_TO_ENUM: dict[str, type[NoValueEnum]] = {
     "from_": FromArg,
     "order": OrderArg,
     "format_": FormatArg,
+    "discovery": DiscoveryArg,
+    "cell_overflow": CellOverflowArg,
 }
 
 
@@ -1089,16 +3365,32 @@ def create_parser(
         version=f"{lit_prog_pat} {__version__}",
     )
 
+    config_python = config_from_file.get("python", [])
     common_options.add_argument(
         "--python",
         type=str,
-        default=config_from_file.get("python", sys.executable),
+        nargs="+",
+        default=(
+            [config_python]
+            if isinstance(config_python, str)
+            else config_python
+        ),
         metavar="PYTHON_EXEC",
         help="R| path to python executable to search distributions from\n"
         "Package will be searched in the selected python's sys.path\n"
         "By default, will search packages for current env executable\n"
+        "With several executables, each package is tagged with the\n"
+        "environment it is installed in\n"
         "(default: sys.executable)",
     )
+    common_options.add_argument(
+        "--python-file",
+        type=str,
+        default=config_from_file.get("python_file", None),
+        metavar="PATH",
+        help="R| file listing python executables to search distributions\n"
+        "from, one per line, in addition to --python",
+    )
 
     common_options.add_argument(
         "--from",
@@ -1125,7 +3417,7 @@ def create_parser(
         metavar="COL",
         choices=choices_from_enum(OrderArg),
         help="R|order by column\n"
-        '"name", "license", "author", "url"\n'
+        '"name", "license", "author", "url", "none"\n'
         "(default: %(default)s)",
     )
     common_options.add_argument(
@@ -1142,7 +3434,7 @@ def create_parser(
         help="R|dump as set format style\n"
         '"plain", "plain-vertical" "markdown", "rst", \n'
         '"confluence", "html", "json", \n'
-        '"json-license-finder",  "csv"\n'
+        '"json-license-finder", "json-lines", "csv"\n'
         "(default: %(default)s)",
     )
     common_options.add_argument(
@@ -1178,6 +3470,127 @@ def create_parser(
         default=config_from_file.get("packages", []),
         help="only include selected packages in output",
     )
+    common_options.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=config_from_file.get("jobs", get_default_jobs()),
+        metavar="N",
+        help="collect package information with N worker threads "
+        "(default: %(default)s)",
+    )
+    common_options.add_argument(
+        "--processes",
+        action="store",
+        type=int,
+        default=config_from_file.get("processes", 1),
+        metavar="N",
+        help="collect package information with N worker processes "
+        "(default: %(default)s)",
+    )
+    common_options.add_argument(
+        "--collect-in-target",
+        action="store_true",
+        default=config_from_file.get("collect_in_target", False),
+        help="discover the distributions with the importlib.metadata of "
+        "the --python executables",
+    )
+    common_options.add_argument(
+        "--discovery",
+        action=SelectAction,
+        type=str,
+        default=get_value_from_enum(
+            DiscoveryArg, config_from_file.get("discovery", "importlib")
+        ),
+        metavar="ENGINE",
+        choices=choices_from_enum(DiscoveryArg),
+        help="R|how to discover the installed distributions\n"
+        '"importlib", "scandir"\n'
+        "(default: %(default)s)",
+    )
+    common_options.add_argument(
+        "--report-shadowed",
+        action="store_true",
+        default=config_from_file.get("report-shadowed", False),
+        help="report the distributions shadowed by another installation "
+        "of the same package found first in sys.path",
+    )
+    common_options.add_argument(
+        "--cache-dir",
+        action="store",
+        type=str,
+        default=config_from_file.get("cache-dir"),
+        metavar="DIR",
+        help="cache the information extracted from each distribution in DIR",
+    )
+    common_options.add_argument(
+        "--cache-max-size",
+        action="store",
+        type=int,
+        default=config_from_file.get("cache-max-size", 64),
+        metavar="MB",
+        help="evict the least recently used entries of the cache beyond "
+        "MB megabytes (default: %(default)s)",
+    )
+    common_options.add_argument(
+        "--cache-report",
+        action="store_true",
+        default=config_from_file.get("cache-report", False),
+        help="reuse the whole output from --cache-dir while the "
+        "distributions and the options are unchanged (see '--fingerprint')",
+    )
+    common_options.add_argument(
+        "--fingerprint",
+        action="store_true",
+        default=False,
+        help="print a fingerprint of the installed distributions and of "
+        "the options, then exit",
+    )
+    common_options.add_argument(
+        "--snapshots",
+        action="store_true",
+        default=config_from_file.get("snapshots", False),
+        help="read the packages of the directories of sys.path which have "
+        "a snapshot from it, without scanning them",
+    )
+    common_options.add_argument(
+        "--write-snapshot",
+        action="store",
+        nargs="+",
+        default=None,
+        metavar="SITE_DIR",
+        help="write a snapshot of the packages installed in each SITE_DIR, "
+        "then exit",
+    )
+    common_options.add_argument(
+        "--state-file",
+        action="store",
+        type=str,
+        default=config_from_file.get("state-file"),
+        metavar="FILE",
+        help="extract only the packages added or changed since the "
+        "previous run with the same FILE",
+    )
+    common_options.add_argument(
+        "--serve",
+        action="store",
+        type=str,
+        default=None,
+        metavar="SOCKET",
+        help="keep the packages in memory and answer the queries of "
+        "'--query SOCKET' on the Unix socket SOCKET",
+    )
+    common_options.add_argument(
+        "--query",
+        action="store",
+        type=str,
+        default=None,
+        metavar="SOCKET",
+        help="get the output from the server listening on SOCKET "
+        "(see '--serve')",
+    )
+    parser.set_defaults(frozen_distributions=None)
     format_options.add_argument(
         "-s",
         "--with-system",
@@ -1257,6 +3670,27 @@ def create_parser(
         metavar="CODE",
         help="I|specify code page for filtering (default: %(default)s)",
     )
+    format_options.add_argument(
+        "--max-cell-width",
+        action="store",
+        type=int,
+        default=config_from_file.get("max-cell-width", 0),
+        metavar="N",
+        help="I|limit the cells of the plain, markdown, rst and confluence "
+        "tables to N columns, 0 for no limit (default: %(default)s)",
+    )
+    format_options.add_argument(
+        "--cell-overflow",
+        action=SelectAction,
+        type=str,
+        default=get_value_from_enum(
+            CellOverflowArg, config_from_file.get("cell-overflow", "wrap")
+        ),
+        metavar="MODE",
+        choices=choices_from_enum(CellOverflowArg),
+        help="I|when specified together with option --max-cell-width, "
+        '"wrap" or "truncate" the wider cells (default: %(default)s)',
+    )
 
     verify_options.add_argument(
         "--fail-on",
@@ -1319,12 +3753,39 @@ def main() -> None:  # pragma: no cover
     parser = create_parser()
     args = parser.parse_args()
 
-    output_string = create_output_string(args)
+    if args.fingerprint:
+        print(get_environment_fingerprint(args))
+        return
+
+    if args.serve:
+        serve(args.serve, get_search_paths(args))
+        return
+
+    if args.query:
+        response = query_server(args.query, sys.argv[1:])
+        sys.stdout.write(response["stdout"])
+        sys.stderr.write(response["stderr"])
+        if response["output"] is None:
+            sys.exit(response["exit"])
+        save_if_needs(args.output_file, response["output"])
+        print(response["output"], end=get_output_end(args))
+        return
+
+    if args.write_snapshot:
+        for site_dir in args.write_snapshot:
+            snapshot_path = write_snapshot(site_dir)
+            sys.stdout.write(f"created path: {snapshot_path}\n")
+        return
+
+    if can_stream_output(args) and not args.cache_report:
+        write_streamed_output(args)
+    else:
+        output_string = create_output_string(args)
 
-    output_file = args.output_file
-    save_if_needs(output_file, output_string)
+        output_file = args.output_file
+        save_if_needs(output_file, output_string)
 
-    print(output_string)
+        print(output_string, end=get_output_end(args))
     warn_string = create_warn_string(args)
     if warn_string:
         print(warn_string, file=sys.stderr)
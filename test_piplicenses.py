@@ -1,16 +1,26 @@
 # vim:fenc=utf-8 ff=unix ft=python ts=4 sw=4 sts=4 si et
 from __future__ import annotations
 
+import asyncio
 import copy
+import csv
 import email
+import importlib.metadata
+import io
+import json
 import os
 import re
+import shutil
 import sys
 import tempfile
+import threading
 import unittest
 import venv
+import zipfile
 from enum import Enum, auto
 from importlib.metadata import Distribution
+from operator import itemgetter
+from pathlib import Path
 from types import SimpleNamespace
 from typing import TYPE_CHECKING, Any
 from unittest.mock import MagicMock
@@ -21,16 +31,23 @@ import docutils.utils
 import pytest
 import tomli_w
 from _pytest.capture import CaptureFixture
-from prettytable import HRuleStyle
+from prettytable import HRuleStyle, PrettyTable
 
 import piplicenses
 from piplicenses import (
     DEFAULT_OUTPUT_FIELDS,
     LICENSE_UNKNOWN,
     SYSTEM_PACKAGES,
+    CachedDistribution,
     CompatibleArgumentParser,
+    DiscoveryArg,
     FromArg,
+    LicenseNotAllowedError,
+    PackageIndex,
+    PackageInfoCache,
+    RowTable,
     __pkgname__,
+    aget_packages,
     case_insensitive_partial_match_set_diff,
     case_insensitive_partial_match_set_intersect,
     case_insensitive_set_diff,
@@ -39,28 +56,43 @@ from piplicenses import (
     create_output_string,
     create_parser,
     create_warn_string,
+    deduplicate_search_paths,
     enum_key_to_value,
     extract_homepage,
     factory_styled_table_with_args,
     find_license_from_classifier,
+    get_default_jobs,
+    get_environment_fingerprint,
     get_output_fields,
     get_packages,
+    get_pkg_included_files,
     get_sortby,
+    map_with_jobs,
     normalize_pkg_name,
     normalize_pkg_name_and_version,
     normalize_version,
     output_colored,
+    parse_dist_info_dirname,
+    parse_metadata_headers,
+    query_server,
+    read_metadata_headers,
+    read_snapshot,
     save_if_needs,
+    scan_distributions,
+    select_included_files,
     select_license_by_source,
+    select_metadata_keys,
     value_to_enum_key,
+    write_snapshot,
 )
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
     if sys.version_info >= (3, 10):
         from importlib.metadata._meta import PackageMetadata
     else:
         from email.message import Message as PackageMetadata
-    from prettytable import PrettyTable
 
 UNICODE_APPENDIX = ""
 with open("tests/fixtures/unicode_characters.txt", encoding="utf-8") as f:
@@ -98,6 +130,56 @@ def importlib_metadata_distributions_mocked(
     return packages
 
 
+class FakeDistribution(Distribution):
+    """Distribution with the given RECORD entries, relative to `root`"""
+
+    def __init__(
+        self, root: Path, files: list[str], metadata: str = ""
+    ) -> None:
+        self._root = root
+        self._record = "".join(f"{file},,\n" for file in files)
+        self._metadata = metadata
+
+    def read_text(self, filename: str) -> str | None:
+        if filename == "RECORD":
+            return self._record
+        if filename == "METADATA":
+            return self._metadata
+        return None
+
+    def locate_file(self, path: str | os.PathLike[str]) -> Path:
+        return self._root / path
+
+
+def make_dist_info(
+    site_dir: Path,
+    name: str,
+    version: str,
+    license_text: str | None = None,
+    *,
+    license_name: str = "MIT",
+    metadata: str = "",
+    dirname: str | None = None,
+) -> Path:
+    """Install a distribution in `site_dir`: a .dist-info directory with its
+    METADATA and RECORD, and a LICENSE file when `license_text` is given.
+    Installing it again overwrites its files.
+    """
+    dist_info = site_dir / (dirname or f"{name}-{version}.dist-info")
+    dist_info.mkdir(parents=True, exist_ok=True)
+    (dist_info / "METADATA").write_text(
+        f"Name: {name}\nVersion: {version}\nLicense: {license_name}\n"
+        + metadata,
+        encoding="utf-8",
+    )
+    record = ""
+    if license_text is not None:
+        (dist_info / "LICENSE").write_text(license_text, encoding="utf-8")
+        record = f"{dist_info.name}/LICENSE,,\n"
+    (dist_info / "RECORD").write_text(record, encoding="utf-8")
+    return dist_info
+
+
 importlib_metadata_distributions_orig = (
     piplicenses.importlib_metadata.distributions
 )
@@ -112,7 +194,7 @@ class CommandLineTestCase(unittest.TestCase):
 
 
 class TestGetLicenses(CommandLineTestCase):
-    def _create_pkg_name_columns(self, table: PrettyTable) -> list:
+    def _create_pkg_name_columns(self, table: PrettyTable | RowTable) -> list:
         _list_DEFAULT_OUTPUT_FIELDS = list(
             DEFAULT_OUTPUT_FIELDS
         )  # cast to list for .index()
@@ -125,7 +207,7 @@ class TestGetLicenses(CommandLineTestCase):
         return pkg_name_columns
 
     def _create_license_columns(
-        self, table: PrettyTable, output_fields: list
+        self, table: PrettyTable | RowTable, output_fields: list
     ) -> list:
         index = output_fields.index("License")
 
@@ -153,6 +235,7 @@ class TestGetLicenses(CommandLineTestCase):
         args = self.parser.parse_args(empty_args)
         table = create_licenses_table(args)
 
+        assert isinstance(table, PrettyTable)
         self.assertIn("l", table.align.values())
         self.assertFalse(table.border)
         self.assertTrue(table.header)
@@ -549,6 +632,44 @@ class TestGetLicenses(CommandLineTestCase):
         pkg_name_columns = self._create_pkg_name_columns(table)
         self.assertListEqual([pkg_name], pkg_name_columns)
 
+    def test_with_jobs(self) -> None:
+        args = self.parser.parse_args(["--with-authors"])
+        jobs_args = self.parser.parse_args(["--with-authors", "--jobs=4"])
+        self.assertEqual(get_default_jobs(), args.jobs)
+        self.assertEqual(4, jobs_args.jobs)
+
+        self.assertListEqual(
+            list(get_packages(args)), list(get_packages(jobs_args))
+        )
+
+    def test_with_processes(self) -> None:
+        args = self.parser.parse_args(["--with-authors"])
+        processes_args = self.parser.parse_args(
+            ["--with-authors", "--processes=2", "--jobs=2"]
+        )
+        self.assertEqual(1, args.processes)
+        self.assertEqual(2, processes_args.processes)
+
+        self.assertListEqual(
+            list(get_packages(args)), list(get_packages(processes_args))
+        )
+
+    def test_discovery_scandir(self) -> None:
+        args = self.parser.parse_args(["--with-system"])
+        scandir_args = self.parser.parse_args(
+            ["--with-system", "--discovery=scandir"]
+        )
+        self.assertEqual(DiscoveryArg.IMPORTLIB, args.discovery)
+        self.assertEqual(DiscoveryArg.SCANDIR, scandir_args.discovery)
+
+        def sort_key(pkg_info: dict) -> tuple[str, str]:
+            return (pkg_info["name"], pkg_info["version"])
+
+        self.assertListEqual(
+            sorted(get_packages(args), key=sort_key),
+            sorted(get_packages(scandir_args), key=sort_key),
+        )
+
     def test_order_name(self) -> None:
         order_name_args = ["--order=name"]
         args = self.parser.parse_args(order_name_args)
@@ -596,6 +717,7 @@ class TestGetLicenses(CommandLineTestCase):
         args = self.parser.parse_args(format_plain_args)
         table = factory_styled_table_with_args(args)
 
+        assert isinstance(table, PrettyTable)
         self.assertIn("l", table.align.values())
         self.assertFalse(table.border)
         self.assertTrue(table.header)
@@ -615,6 +737,7 @@ class TestGetLicenses(CommandLineTestCase):
         args = self.parser.parse_args(format_markdown_args)
         table = create_licenses_table(args)
 
+        assert isinstance(table, PrettyTable)
         self.assertIn("l", table.align.values())
         self.assertTrue(table.border)
         self.assertTrue(table.header)
@@ -629,6 +752,7 @@ class TestGetLicenses(CommandLineTestCase):
         args = self.parser.parse_args(format_rst_args)
         table = create_licenses_table(args)
 
+        assert isinstance(table, PrettyTable)
         self.assertIn("l", table.align.values())
         self.assertTrue(table.border)
         self.assertTrue(table.header)
@@ -646,6 +770,7 @@ class TestGetLicenses(CommandLineTestCase):
         args = self.parser.parse_args(format_rst_args)
         table = create_licenses_table(args)
 
+        assert isinstance(table, PrettyTable)
         self.assertIn("l", table.align.values())
         self.assertTrue(table.border)
         self.assertTrue(table.header)
@@ -661,6 +786,7 @@ class TestGetLicenses(CommandLineTestCase):
         args = self.parser.parse_args(format_confluence_args)
         table = create_licenses_table(args)
 
+        assert isinstance(table, PrettyTable)
         self.assertIn("l", table.align.values())
         self.assertTrue(table.border)
         self.assertTrue(table.header)
@@ -693,6 +819,20 @@ class TestGetLicenses(CommandLineTestCase):
         self.assertIn('"version":', output_string)
         self.assertIn('"licenses":', output_string)
 
+    def test_format_json_lines(self) -> None:
+        format_json_lines_args = ["--format=json-lines", "--with-authors"]
+        args = self.parser.parse_args(format_json_lines_args)
+        output_string = create_output_string(args)
+
+        self.assertTrue(output_string.endswith("\n"))
+        lines = output_string.splitlines()
+        pkgs = [json.loads(line) for line in lines]
+        self.assertEqual(len(list(get_packages(args))), len(pkgs))
+        for pkg in pkgs:
+            self.assertEqual(
+                ["Author", "License", "Name", "Version"], list(pkg)
+            )
+
     def test_format_csv(self) -> None:
         format_csv_args = ["--format=csv", "--with-authors"]
         args = self.parser.parse_args(format_csv_args)
@@ -702,6 +842,27 @@ class TestGetLicenses(CommandLineTestCase):
         expected_header = '"Name","Version","License","Author"'
         self.assertEqual(obtained_header, expected_header)
 
+    def test_format_csv_round_trip(self) -> None:
+        format_csv_args = ["--format=csv", "--with-license-file"]
+        args = self.parser.parse_args(format_csv_args)
+        output_fields = get_output_fields(args)
+        table = create_licenses_table(args, output_fields)
+        assert isinstance(table, RowTable)
+
+        output_string = create_output_string(args)
+        rows = list(csv.reader(io.StringIO(output_string)))
+        self.assertEqual(output_fields, rows[0])
+        self.assertEqual(table.get_rows(sortby="Name"), rows[1:])
+
+    def test_summary_format_csv(self) -> None:
+        summary_args = ["--summary", "--format=csv"]
+        args = self.parser.parse_args(summary_args)
+        output_string = create_output_string(args)
+
+        rows = list(csv.reader(io.StringIO(output_string)))
+        self.assertEqual(["Count", "License"], sorted(rows[0]))
+        self.assertTrue(all(len(row) == 2 for row in rows[1:]))
+
     def test_summary(self) -> None:
         summary_args = ["--summary"]
         args = self.parser.parse_args(summary_args)
@@ -872,10 +1033,330 @@ class MockStdStream:
         self.printed = p
 
 
-def test_output_file_success(monkeypatch: pytest.MonkeyPatch) -> None:
-    if TYPE_CHECKING:
-        import io
+@pytest.mark.parametrize(
+    "format_", ["csv", "json", "json-lines", "plain-vertical", "html"]
+)
+@pytest.mark.parametrize("order", ["name", "license", "none"])
+def test_iter_output_chunks(format_: str, order: str) -> None:
+    # the rows streamed and sorted on disk are the rows of the table
+    # sorted in memory, see test_machine_format_output() for the format
+    args = create_parser().parse_args(
+        [
+            f"--format={format_}",
+            f"--order={order}",
+            "--with-system",
+            "--with-authors",
+            "--with-license-file",
+            "--with-notice-file",
+        ]
+    )
+    output_fields = get_output_fields(args)
+    table = create_licenses_table(args, output_fields)
+    sortby = get_sortby(args)
+    if format_ == "html":
+        assert isinstance(table, PrettyTable)
+        html = table.get_html_string(fields=output_fields, sortby=sortby)
+        expected = html.encode("ascii", errors="xmlcharrefreplace").decode()
+    else:
+        expected = table.get_string(fields=output_fields, sortby=sortby)
+
+    assert "".join(piplicenses.iter_output_chunks(args)) == expected
+
+
+@pytest.mark.parametrize("format_", ["plain", "markdown", "rst", "confluence"])
+@pytest.mark.parametrize("summary_args", [[], ["--summary"]])
+def test_render_text_table(format_: str, summary_args: list[str]) -> None:
+    args = create_parser().parse_args(
+        [f"--format={format_}", "--with-authors", "--with-license-file"]
+        + summary_args
+    )
+    output_fields = get_output_fields(args)
+    if args.summary:
+        table = piplicenses.create_summary_table(args)
+    else:
+        table = create_licenses_table(args, output_fields)
+        table.add_row(
+            [
+                f"unicode {UNICODE_APPENDIX}",
+                "1.0",
+                "MIT",
+                f"Jane\tDoe {UNICODE_APPENDIX}",
+                "/path/LICENSE",
+                f"wide\n{UNICODE_APPENDIX * 3}\n\x1b[1mbold\x1b[0m",
+            ]
+        )
+    assert isinstance(table, PrettyTable)
+    sortby = get_sortby(args)
+
+    assert piplicenses.render_text_table(
+        table, output_fields, sortby
+    ) == table.get_string(fields=output_fields, sortby=sortby)
+
+
+def test_get_display_width() -> None:
+    import wcwidth
 
+    assert piplicenses.get_display_width("") == 0
+    assert piplicenses.get_display_width("MIT License") == 11
+    for char in UNICODE_APPENDIX:
+        assert piplicenses.get_display_width(char) == wcwidth.wcswidth(char)
+    assert piplicenses.get_display_width(UNICODE_APPENDIX) == (
+        wcwidth.wcswidth(UNICODE_APPENDIX)
+    )
+    assert piplicenses.get_display_width("a\x1bb") == 2
+
+
+@pytest.mark.parametrize("cell_overflow", ["wrap", "truncate"])
+def test_max_cell_width(cell_overflow: str) -> None:
+    fit_cell = piplicenses.fit_cell
+    truncate = cell_overflow == "truncate"
+
+    assert fit_cell("MIT License", 11, truncate) == "MIT License"
+    text = "Permission is hereby granted\n\nfree of charge"
+    if truncate:
+        assert fit_cell(text, 10, truncate) == "Permission\n\nfree of ch"
+    else:
+        assert fit_cell(text, 10, truncate) == (
+            "Permission\nis hereby\ngranted\n\nfree of\ncharge"
+        )
+    wrapped = fit_cell(UNICODE_APPENDIX * 2, 3, truncate).split("\n")
+    assert all(piplicenses.get_display_width(line) <= 3 for line in wrapped)
+    assert len(wrapped) == (1 if truncate else 6)
+
+    format_args = ["--format=plain", "--with-license-file"]
+    args = create_parser().parse_args(format_args)
+    unlimited_lines = create_output_string(args).split("\n")
+    args = create_parser().parse_args(
+        [
+            *format_args,
+            "--max-cell-width=20",
+            f"--cell-overflow={cell_overflow}",
+        ]
+    )
+    output_fields = get_output_fields(args)
+    lines = create_output_string(args).split("\n")
+    assert all(len(line) <= len(output_fields) * 22 for line in lines)
+    if truncate:
+        assert len(lines) == len(unlimited_lines)
+    else:
+        assert len(lines) > len(unlimited_lines)
+
+
+@pytest.mark.parametrize(
+    "format_args",
+    [["--format=json"], ["--format=json-license-finder"], ["--format=csv"]],
+)
+@pytest.mark.parametrize("summary_args", [[], ["--summary"]])
+def test_machine_formats_without_prettytable(
+    format_args: list[str],
+    summary_args: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # importing prettytable now raises ImportError
+    monkeypatch.setitem(sys.modules, "prettytable", None)
+    args = create_parser().parse_args(format_args + summary_args)
+    assert create_output_string(args)
+
+
+def test_row_table() -> None:
+    with pytest.raises(TypeError):
+        RowTable(["Name"])  # type: ignore[abstract]
+
+    table = piplicenses.CSVPrettyTable(["Name", "Version", "License"])
+    table.add_row(["b", "2.0", "MIT"])
+    table.add_row(["a", "1.0", "MIT"])
+    table.add_row(["c", "0.1", "BSD"])
+
+    assert table.get_rows() == table.rows
+    assert table.get_rows(fields=["License", "Name"], sortby="License") == [
+        ["c", "BSD"],
+        ["a", "MIT"],
+        ["b", "MIT"],
+    ]
+    assert table.get_string(fields=["Name"], sortby="Name") == (
+        '"Name"\n"a"\n"b"\n"c"'
+    )
+
+
+@pytest.mark.parametrize(
+    ("format_", "expected"),
+    [
+        (
+            "csv",
+            (
+                '"Name","Version","License","Author","LicenseText"\n'
+                '"bar","2.0","BSD","Zoë","UNKNOWN"\n'
+                '"foo","1.0","MIT","Jane ""JD"" Doe","Copyright\tJane\nline 2 ü\n"'
+            ),
+        ),
+        (
+            "json",
+            (
+                "[\n"
+                "  {\n"
+                '    "Author": "Zo\\u00eb",\n'
+                '    "License": "BSD",\n'
+                '    "LicenseText": "UNKNOWN",\n'
+                '    "Name": "bar",\n'
+                '    "Version": "2.0"\n'
+                "  },\n"
+                "  {\n"
+                '    "Author": "Jane \\"JD\\" Doe",\n'
+                '    "License": "MIT",\n'
+                '    "LicenseText": "Copyright\\tJane\\nline 2 \\u00fc\\n",\n'
+                '    "Name": "foo",\n'
+                '    "Version": "1.0"\n'
+                "  }\n"
+                "]"
+            ),
+        ),
+        (
+            "json-license-finder",
+            (
+                '[{"licenses": ["BSD"], "name": "bar", "version": "2.0"}, '
+                '{"licenses": ["MIT"], "name": "foo", "version": "1.0"}]'
+            ),
+        ),
+        (
+            "json-lines",
+            (
+                '{"Author": "Zo\\u00eb", "License": "BSD", "LicenseText": '
+                '"UNKNOWN", "Name": "bar", "Version": "2.0"}\n'
+                '{"Author": "Jane \\"JD\\" Doe", "License": "MIT", "LicenseText": '
+                '"Copyright\\tJane\\nline 2 \\u00fc\\n", "Name": "foo", '
+                '"Version": "1.0"}\n'
+            ),
+        ),
+        (
+            "plain-vertical",
+            (
+                "bar\n2.0\nBSD\nZoë\nUNKNOWN\n\n"
+                'foo\n1.0\nMIT\nJane "JD" Doe\nCopyright\tJane\nline 2 ü\n\n\n'
+            ),
+        ),
+    ],
+)
+def test_machine_format_output(
+    format_: str,
+    expected: str,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    site_packages = tmp_path / "site-packages"
+    make_dist_info(
+        site_packages,
+        "foo",
+        "1.0",
+        "Copyright\tJane\nline 2 ü\n",
+        metadata='Author: Jane "JD" Doe\n',
+    )
+    make_dist_info(
+        site_packages,
+        "bar",
+        "2.0",
+        license_name="BSD",
+        metadata="Author: Zoë\n",
+    )
+    monkeypatch.setattr(sys, "path", [str(site_packages)])
+    args = create_parser().parse_args(
+        [
+            f"--format={format_}",
+            "--with-authors",
+            "--with-license-file",
+            "--no-license-path",
+            "--order=license",
+        ]
+    )
+
+    # the streamed output and the output of the table
+    assert "".join(piplicenses.iter_output_chunks(args)) == expected
+    output_fields = get_output_fields(args)
+    table = create_licenses_table(args, output_fields)
+    assert table.get_string(fields=output_fields, sortby="License") == expected
+
+
+@pytest.mark.parametrize("run_size", [3, 100])
+def test_sort_rows_on_disk(
+    run_size: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(piplicenses, "SORT_RUN_SIZE", run_size)
+    output_fields = ["Name", "Version", "License", "LicenseText"]
+    rows = [
+        [f"pkg{index % 4}", f"1.{index % 3}", "MIT", f"text {index}"]
+        for index in range(10)
+    ]
+    sorted_rows = list(
+        piplicenses.sort_rows_on_disk(iter(rows), output_fields, "License")
+    )
+    # sorted by the other fields, then in input order
+    assert sorted_rows == sorted(rows, key=lambda row: row[:3])
+
+
+def test_write_streamed_output(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: CaptureFixture,
+) -> None:
+    parser = create_parser()
+    args = parser.parse_args(["--format=csv", "--order=none"])
+    expected = create_output_string(args)
+
+    piplicenses.write_streamed_output(args)
+    assert capsys.readouterr().out == expected + "\n"
+
+    # the records of JSON Lines already end with a newline
+    args = parser.parse_args(["--format=jsonl"])
+    expected_lines = create_output_string(args)
+    piplicenses.write_streamed_output(args)
+    assert capsys.readouterr().out == expected_lines
+
+    output_file = tmp_path / "licenses.csv"
+    args = parser.parse_args(
+        ["--format=csv", "--order=none", f"--output-file={output_file}"]
+    )
+    with pytest.raises(SystemExit) as ex:
+        piplicenses.write_streamed_output(args)
+    assert ex.value.code == 0
+    assert capsys.readouterr().out == f"created path: {output_file}\n"
+    assert output_file.read_text(encoding="utf-8") == expected + "\n"
+
+    args = parser.parse_args(
+        ["--format=csv", f"--output-file={tmp_path / 'missing' / 'a.csv'}"]
+    )
+    with pytest.raises(SystemExit) as ex:
+        piplicenses.write_streamed_output(args)
+    assert ex.value.code == 1
+    assert "check path: --output-file" in capsys.readouterr().err
+
+    # a failed license check outputs nothing, not even the header, and
+    # leaves the previous output file untouched
+    for output_args in ([], [f"--output-file={output_file}"]):
+        args = parser.parse_args(
+            ["--format=csv", "--fail-on=MIT", "--partial-match", *output_args]
+        )
+        with pytest.raises(SystemExit) as ex:
+            piplicenses.write_streamed_output(args)
+        assert ex.value.code == 1
+        captured = capsys.readouterr()
+        assert captured.out == ""
+        assert "fail-on license" in captured.err
+    assert output_file.read_text(encoding="utf-8") == expected + "\n"
+    assert [path.name for path in tmp_path.iterdir()] == [output_file.name]
+
+    # the errors of the collection are not reported as output file errors
+    def get_packages_failing(*args: Any, **kwargs: Any) -> Iterator[dict]:
+        raise PermissionError("LICENSE")
+        yield {}
+
+    monkeypatch.setattr(piplicenses, "get_packages", get_packages_failing)
+    args = parser.parse_args(["--format=csv", f"--output-file={output_file}"])
+    with pytest.raises(PermissionError):
+        piplicenses.write_streamed_output(args)
+    assert output_file.read_text(encoding="utf-8") == expected + "\n"
+    assert [path.name for path in tmp_path.iterdir()] == [output_file.name]
+
+
+def test_output_file_success(monkeypatch: pytest.MonkeyPatch) -> None:
     def mocked_open(*args: Any, **kwargs: Any) -> io.TextIOWrapper:
         import tempfile
 
@@ -1107,6 +1588,1059 @@ def test_fail_on_partial_match(monkeypatch: pytest.MonkeyPatch) -> None:
     )
 
 
+def test_fail_on_with_jobs(monkeypatch: pytest.MonkeyPatch) -> None:
+    licenses = ("MIT license",)
+    fail_on_args = ["--jobs=4", "--fail-on={}".format(";".join(licenses))]
+    mocked_stdout = MockStdStream()
+    mocked_stderr = MockStdStream()
+    monkeypatch.setattr(sys.stdout, "write", mocked_stdout.write)
+    monkeypatch.setattr(sys.stderr, "write", mocked_stderr.write)
+    monkeypatch.setattr(sys, "exit", lambda n: None)
+    args = create_parser().parse_args(fail_on_args)
+    create_licenses_table(args)
+
+    assert "" == mocked_stdout.printed
+    assert (
+        "fail-on license MIT License was found for package"
+        in mocked_stderr.printed
+    )
+
+
+def test_aget_packages() -> None:
+    parser = create_parser()
+
+    async def collect(argv: list[str], limit: int | None = None) -> list[dict]:
+        pkgs = []
+        async for pkg in aget_packages(parser.parse_args(argv)):
+            pkgs.append(pkg)
+            if len(pkgs) == limit:
+                break
+        return pkgs
+
+    for argv in (["--with-authors"], ["--with-authors", "--jobs=4"]):
+        assert asyncio.run(collect(argv)) == list(
+            get_packages(parser.parse_args(argv))
+        )
+
+    # stopping early cancels the pending work
+    assert len(asyncio.run(collect(["--jobs=4"], limit=1))) == 1
+
+    with pytest.raises(LicenseNotAllowedError, match="MIT License"):
+        asyncio.run(collect(["--fail-on=MIT license"]))
+
+
+def test_select_included_files() -> None:
+    assert select_included_files(None) == ["license", "notice", "other"]
+    assert select_included_files(DEFAULT_OUTPUT_FIELDS) == []
+    assert select_included_files(["Name", "LicenseText"]) == ["license"]
+    assert select_included_files(["NoticeFile", "LicenseFile"]) == [
+        "license",
+        "notice",
+    ]
+
+
+def test_select_metadata_keys() -> None:
+    assert select_metadata_keys(None) == list(piplicenses.METADATA_KEYS)
+    assert select_metadata_keys(["Name", "Version", "License"]) == [
+        "license",
+        "license_expression",
+    ]
+    assert select_metadata_keys(["Count", "License"]) == [
+        "license",
+        "license_expression",
+    ]
+    assert select_metadata_keys(["Name", "URL", "Author"]) == [
+        "home-page",
+        "author",
+        "license",
+        "license_expression",
+    ]
+
+
+def test_projection_without_included_files(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def mocked_open(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("no included file should be read")
+
+    args = create_parser().parse_args(["--with-urls"])
+    summary_args = create_parser().parse_args(["--summary"])
+    monkeypatch.setattr(piplicenses, "open", mocked_open)
+    output_fields = get_output_fields(args)
+    packages = list(get_packages(args, output_fields))
+
+    assert packages
+    for pkg in packages:
+        assert "licensetext" not in pkg
+        assert "othertext" not in pkg
+        assert "home-page" in pkg
+        assert "author" not in pkg
+
+    assert "Count" in create_output_string(summary_args)
+
+
+def test_projection_with_included_files() -> None:
+    args = create_parser().parse_args(
+        ["--with-license-file", "--with-notice-file"]
+    )
+    output_fields = get_output_fields(args)
+    packages = list(get_packages(args, output_fields))
+
+    assert packages
+    for pkg in packages:
+        assert "licensetext" in pkg
+        assert "noticetext" in pkg
+        assert "othertext" not in pkg
+
+
+def test_cached_distribution() -> None:
+    dist = CachedDistribution(importlib.metadata.distribution("pytest"))
+    assert dist.load_count == {}
+
+    assert dist.metadata["name"] == "pytest"
+    assert dist.metadata["version"] == dist.version
+    assert dist.name == "pytest"
+    assert dist.files
+    assert dist.files == dist.files
+    assert dist.read_text("METADATA")
+    assert dist.locate_file("pytest") is not None
+
+    assert dist.load_count == {"metadata": 1, "files": 1}
+
+
+def test_parse_metadata_headers() -> None:
+    metadata = parse_metadata_headers(
+        [
+            b"Metadata-Version: 2.1\r\n",
+            b"Name: foo\r\n",
+            b"Version: 1.0\r\n",
+            b"License: Copyright (c) foo\r\n",
+            b"        \r\n",
+            b"        All rights reserved.\r\n",
+            b"Classifier: License :: OSI Approved :: MIT License\r\n",
+            b"classifier: Programming Language :: Python\r\n",
+            b"Author-email: Foo <foo@example.com>\r\n",
+            b"\r\n",
+            b"Name: long description\r\n",
+        ]
+    )
+
+    assert len(metadata) == 7
+    assert list(metadata)[:3] == ["Metadata-Version", "Name", "Version"]
+    assert "name" in metadata
+    assert "Description" not in metadata
+    assert metadata["name"] == "foo"
+    assert metadata["VERSION"] == "1.0"
+    assert (
+        metadata.get("license") == "Copyright (c) foo\n\nAll rights reserved."
+    )
+    assert metadata.get("home-page") is None
+    assert metadata.get("home-page", LICENSE_UNKNOWN) == LICENSE_UNKNOWN
+    assert metadata.get_all("Classifier") == [
+        "License :: OSI Approved :: MIT License",
+        "Programming Language :: Python",
+    ]
+    assert metadata.get_all("Project-URL", []) == []
+    assert metadata.json["author_email"] == "Foo <foo@example.com>"
+    assert len(metadata.json["classifier"]) == 2
+    with pytest.raises(KeyError):
+        metadata["summary"]
+
+    assert len(parse_metadata_headers([b"no header\n", b"Name: foo\n"])) == 0
+
+
+def test_metadata_headers_match_email_parser() -> None:
+    keys = [
+        "name",
+        "version",
+        "license",
+        "license-expression",
+        "author",
+        "author-email",
+        "maintainer",
+        "maintainer-email",
+        "summary",
+        "home-page",
+    ]
+    for dist in importlib.metadata.distributions():
+        path = dist._path  # type: ignore[attr-defined]
+        headers = read_metadata_headers(path)
+        assert headers is not None
+        for key in keys:
+            assert headers.get(key) == dist.metadata.get(key)  # type: ignore[attr-defined]
+        for key in ("classifier", "project-url", "license-file"):
+            assert headers.get_all(key) == dist.metadata.get_all(key)
+        assert extract_homepage(headers) == extract_homepage(
+            dist.metadata  # type: ignore[arg-type]
+        )
+
+
+def test_read_metadata_headers(tmp_path: Path) -> None:
+    egg_info_dir = tmp_path / "foo-1.0.egg-info"
+    egg_info_dir.mkdir()
+    (egg_info_dir / "PKG-INFO").write_bytes(b"Name: foo\nVersion: 1.0\n")
+    egg_info_file = tmp_path / "bar-2.0.egg-info"
+    egg_info_file.write_bytes(b"Name: bar\nVersion: 2.0\n")
+
+    foo_headers = read_metadata_headers(egg_info_dir)
+    bar_headers = read_metadata_headers(egg_info_file)
+
+    assert foo_headers is not None
+    assert foo_headers["name"] == "foo"
+    assert bar_headers is not None
+    assert bar_headers["name"] == "bar"
+    assert read_metadata_headers(tmp_path / "missing.dist-info") is None
+
+
+def test_get_pkg_included_files(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for file_name in ("LICENSE.txt", "COPYING", "NOTICE", "AUTHORS.rst"):
+        (tmp_path / file_name).write_text(file_name, encoding="utf-8")
+    dist = FakeDistribution(
+        tmp_path,
+        [
+            "foo/__init__.py",
+            "foo-1.0.dist-info/license.missing",
+            "LICENSE.txt",
+            "COPYING",
+            "NOTICE",
+            "AUTHORS.rst",
+        ],
+    )
+
+    checked: list[str] = []
+    is_file_orig = Path.is_file
+
+    def counted_is_file(self: Path) -> bool:
+        checked.append(self.name)
+        return is_file_orig(self)
+
+    monkeypatch.setattr(Path, "is_file", counted_is_file)
+    included_files = get_pkg_included_files(dist, ["license", "notice"])
+
+    assert included_files == {
+        "license": (str(tmp_path / "LICENSE.txt"), "LICENSE.txt"),
+        "notice": (str(tmp_path / "NOTICE"), "NOTICE"),
+    }
+    # only the winning candidates (and the missing one before) are checked
+    assert checked == ["license.missing", "LICENSE.txt", "NOTICE"]
+
+    assert get_pkg_included_files(dist, []) == {}
+    assert get_pkg_included_files(dist, ["other"]) == {
+        "other": (str(tmp_path / "AUTHORS.rst"), "AUTHORS.rst")
+    }
+    assert get_pkg_included_files(
+        FakeDistribution(tmp_path, []), ["notice"]
+    ) == {"notice": (LICENSE_UNKNOWN, LICENSE_UNKNOWN)}
+
+
+def test_get_pkg_included_files_from_license_file_headers(
+    tmp_path: Path,
+) -> None:
+    dist_info = tmp_path / "foo-1.0.dist-info"
+    (dist_info / "licenses" / "sub").mkdir(parents=True)
+    (dist_info / "licenses" / "sub" / "LICENSE").write_text(
+        "PEP 639", encoding="utf-8"
+    )
+    (dist_info / "AUTHORS").write_text("setuptools", encoding="utf-8")
+    (dist_info / "METADATA").write_text(
+        "Name: foo\nVersion: 1.0\n"
+        "License-File: ../../outside\n"
+        "License-File: sub/LICENSE\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "LICENSE.txt").write_text("RECORD", encoding="utf-8")
+    (dist_info / "RECORD").write_text("LICENSE.txt,,\n", encoding="utf-8")
+
+    dist = CachedDistribution(importlib.metadata.PathDistribution(dist_info))
+    assert get_pkg_included_files(dist, ["license"]) == {
+        "license": (str(dist_info / "licenses" / "sub" / "LICENSE"), "PEP 639")
+    }
+    # RECORD is not needed when the headers point to the license file
+    assert dist.load_count["files"] == 0
+
+    # the declared license files are preferred to AUTHORS or NOTICE files
+    (dist_info / "METADATA").write_text(
+        "License-File: AUTHORS\nLicense-File: sub/LICENSE\n",
+        encoding="utf-8",
+    )
+    dist = CachedDistribution(importlib.metadata.PathDistribution(dist_info))
+    assert get_pkg_included_files(dist, ["license"]) == {
+        "license": (str(dist_info / "licenses" / "sub" / "LICENSE"), "PEP 639")
+    }
+
+    # older setuptools put the license files in the .dist-info directly
+    (dist_info / "METADATA").write_text(
+        "License-File: AUTHORS\n", encoding="utf-8"
+    )
+    dist = CachedDistribution(importlib.metadata.PathDistribution(dist_info))
+    assert get_pkg_included_files(dist, ["license"]) == {
+        "license": (str(dist_info / "AUTHORS"), "setuptools")
+    }
+
+    # fallback to RECORD when the declared files are missing
+    (dist_info / "METADATA").write_text(
+        "License-File: MISSING\n", encoding="utf-8"
+    )
+    dist = CachedDistribution(importlib.metadata.PathDistribution(dist_info))
+    assert get_pkg_included_files(dist, ["license"]) == {
+        "license": (str(tmp_path / "LICENSE.txt"), "RECORD")
+    }
+    assert dist.load_count["files"] == 1
+
+
+def test_get_packages_reads_metadata_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    reads: dict[tuple[str, str], int] = {}
+    read_text_orig = importlib.metadata.PathDistribution.read_text
+
+    def counted_read_text(
+        self: importlib.metadata.PathDistribution, filename: str
+    ) -> str | None:
+        key = (str(self._path), filename)  # type: ignore[attr-defined]
+        reads[key] = reads.get(key, 0) + 1
+        return read_text_orig(self, filename)
+
+    monkeypatch.setattr(
+        importlib.metadata.PathDistribution, "read_text", counted_read_text
+    )
+    args = create_parser().parse_args(
+        ["--with-license-file", "--with-notice-file", "--with-authors"]
+    )
+    packages = list(get_packages(args, get_output_fields(args)))
+
+    assert packages
+    assert reads
+    assert set(reads.values()) == {1}
+
+
+def test_scan_distributions(tmp_path: Path) -> None:
+    site_packages = tmp_path / "site-packages"
+    make_dist_info(site_packages, "foo", "1.0")
+    (site_packages / "Bar-2.0.EGG-INFO").write_text(
+        "Name: Bar\nVersion: 2.0\n", encoding="utf-8"
+    )
+    (site_packages / "foo").mkdir()
+    (site_packages / "README.txt").write_text("", encoding="utf-8")
+    with zipfile.ZipFile(tmp_path / "baz.zip", "w") as zip_file:
+        zip_file.writestr("baz-3.0.dist-info/METADATA", "Name: baz\n")
+    (tmp_path / "qux-4.0.egg" / "EGG-INFO").mkdir(parents=True)
+    (tmp_path / "qux-4.0.egg" / "EGG-INFO" / "PKG-INFO").write_text(
+        "Name: qux\n", encoding="utf-8"
+    )
+
+    search_paths = [
+        str(site_packages),
+        str(tmp_path / "baz.zip"),
+        str(tmp_path / "qux-4.0.egg"),
+        str(tmp_path / "missing"),
+    ]
+    dists = list(scan_distributions(search_paths))
+    assert sorted(dist.metadata["Name"] for dist in dists) == [
+        "Bar",
+        "baz",
+        "foo",
+        "qux",
+    ]
+    assert sorted(dist.metadata["Name"] for dist in dists) == sorted(
+        dist.metadata["Name"]
+        for dist in importlib.metadata.distributions(path=search_paths)
+    )
+
+
+def test_get_packages_looks_up_requested_packages(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    lookups: list[str | None] = []
+
+    def recorded_distributions(
+        name: str | None = None, **kwargs: Any
+    ) -> Iterable[Distribution]:
+        lookups.append(name)
+        return importlib_metadata_distributions_orig(name=name, **kwargs)
+
+    monkeypatch.setattr(
+        piplicenses.importlib_metadata,
+        "distributions",
+        recorded_distributions,
+    )
+    parser = create_parser()
+
+    args = parser.parse_args(["--packages", "Docutils", "pytest", "nope"])
+    assert sorted(pkg["name"] for pkg in get_packages(args)) == [
+        "docutils",
+        "pytest",
+    ]
+    assert lookups == ["docutils", "pytest", "nope"]
+
+    lookups.clear()
+    args = parser.parse_args(["--packages", "pytest", "--discovery=scandir"])
+    assert [pkg["name"] for pkg in get_packages(args)] == ["pytest"]
+    assert lookups == []
+
+
+def test_deduplicate_search_paths(tmp_path: Path) -> None:
+    (tmp_path / "site-packages").mkdir()
+    (tmp_path / "link").symlink_to(tmp_path / "site-packages")
+    search_paths = [
+        str(tmp_path / "site-packages"),
+        str(tmp_path / "link"),
+        str(tmp_path / "site-packages") + "/",
+        str(tmp_path / "other"),
+    ]
+    assert deduplicate_search_paths(search_paths) == [
+        str(tmp_path / "site-packages"),
+        str(tmp_path / "other"),
+    ]
+
+
+@pytest.mark.parametrize("discovery", ["importlib", "scandir"])
+def test_get_packages_skips_shadowed_distributions(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: CaptureFixture,
+    discovery: str,
+) -> None:
+    for site_packages, name, version in (
+        ("user", "Foo_Bar", "2.0"),
+        ("system", "foo_bar", "1.0"),
+        ("system", "baz", "1.0"),
+    ):
+        make_dist_info(tmp_path / site_packages, name, version)
+    (tmp_path / "link").symlink_to(tmp_path / "system")
+    monkeypatch.setattr(
+        sys,
+        "path",
+        [
+            str(tmp_path / "user"),
+            str(tmp_path / "system"),
+            str(tmp_path / "link"),
+        ],
+    )
+    parser = create_parser()
+
+    args = parser.parse_args([f"--discovery={discovery}"])
+    assert sorted(
+        (pkg["name"], pkg["version"]) for pkg in get_packages(args)
+    ) == [("Foo_Bar", "2.0"), ("baz", "1.0")]
+    assert capsys.readouterr().err == ""
+
+    args = parser.parse_args([f"--discovery={discovery}", "--report-shadowed"])
+    assert len(list(get_packages(args))) == 2
+    assert capsys.readouterr().err == (
+        "distribution foo_bar 1.0 at {} is shadowed by 2.0 at {}\n".format(
+            tmp_path / "system" / "foo_bar-1.0.dist-info",
+            tmp_path / "user" / "Foo_Bar-2.0.dist-info",
+        )
+    )
+
+
+def test_package_info_cache(tmp_path: Path) -> None:
+    dist_info = make_dist_info(tmp_path, "foo", "1.0")
+    dist = importlib.metadata.PathDistribution(dist_info)
+    cache = PackageInfoCache(str(tmp_path / "cache"), 1024, ["license"])
+
+    entry_path = cache.get_entry_path(dist)
+    assert entry_path is not None
+    assert entry_path == cache.get_entry_path(dist)
+    assert cache.load(entry_path) is None
+
+    pkg_info: dict[str, str | list[str]] = {"name": "foo", "license": "MIT"}
+    cache.store(entry_path, pkg_info)
+    assert cache.load(entry_path) == pkg_info
+    assert [path.name for path in (tmp_path / "cache").iterdir()] == [
+        entry_path.name
+    ]
+
+    # the entry changes with the files of the distribution and the options
+    (dist_info / "RECORD").write_text("RECORD,,\n", encoding="utf-8")
+    assert cache.get_entry_path(dist) != entry_path
+    other_cache = PackageInfoCache(str(tmp_path / "cache"), 1024, [])
+    assert other_cache.get_entry_path(dist) != cache.get_entry_path(dist)
+    egg_info = tmp_path / "foo.egg-info"
+    egg_info.mkdir()
+    assert (
+        cache.get_entry_path(importlib.metadata.PathDistribution(egg_info))
+        is None
+    )
+
+    entry_path.write_text("{", encoding="utf-8")
+    assert cache.load(entry_path) is None
+
+
+def test_package_info_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = PackageInfoCache(str(tmp_path), 1000, [])
+    for index in range(4):
+        entry_path = tmp_path / f"{index}.json"
+        cache.store(entry_path, {"text": "x" * 390})
+        os.utime(entry_path, (index, index))
+    # loading refreshes the entry
+    assert cache.load(tmp_path / "0.json") is not None
+
+    cache.evict()
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == [
+        "0.json",
+        "3.json",
+    ]
+
+
+def test_package_info_cache_unusable_dir(
+    tmp_path: Path, capsys: CaptureFixture
+) -> None:
+    (tmp_path / "file").write_text("", encoding="utf-8")
+    cache_dir = str(tmp_path / "file" / "cache")
+    args = create_parser().parse_args(
+        ["--format=json", f"--cache-dir={cache_dir}"]
+    )
+
+    assert json.loads(create_output_string(args))
+    assert capsys.readouterr().err.count("check path: --cache-dir") == 1
+
+
+def test_get_packages_with_cache_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, opened_metadata: list[str]
+) -> None:
+    site_packages = tmp_path / "site-packages"
+    for name in ("foo", "bar"):
+        make_dist_info(site_packages, name, "1.0")
+
+    monkeypatch.setattr(sys, "path", [str(site_packages)])
+    parser = create_parser()
+    args = parser.parse_args(
+        ["--cache-dir", str(tmp_path / "cache"), "--with-urls"]
+    )
+
+    pkgs = sorted(get_packages(args), key=itemgetter("name"))
+    assert [pkg["name"] for pkg in pkgs] == ["bar", "foo"]
+    assert sorted(opened_metadata) == [
+        "bar-1.0.dist-info",
+        "foo-1.0.dist-info",
+    ]
+
+    opened_metadata.clear()
+    assert sorted(get_packages(args), key=itemgetter("name")) == pkgs
+    assert opened_metadata == []
+
+    # a changed distribution is extracted again
+    make_dist_info(site_packages, "foo", "1.0", license_name="BSD")
+    pkgs = sorted(get_packages(args), key=itemgetter("name"))
+    assert [pkg["license"] for pkg in pkgs] == ["MIT", "BSD"]
+    assert opened_metadata == ["foo-1.0.dist-info"]
+
+
+def test_get_environment_fingerprint(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "foo-1.0.dist-info").mkdir()
+    (tmp_path / "foo").mkdir()
+    (tmp_path / "bar.zip").write_bytes(b"")
+    monkeypatch.setattr(
+        sys, "path", [str(tmp_path), str(tmp_path / "bar.zip"), "/missing"]
+    )
+    parser = create_parser()
+
+    fingerprint = get_environment_fingerprint(parser.parse_args([]))
+    assert len(fingerprint) == 64
+    assert fingerprint == get_environment_fingerprint(parser.parse_args([]))
+    # options without effect on the output are ignored
+    assert fingerprint == get_environment_fingerprint(
+        parser.parse_args(["--jobs=2", "--discovery=scandir"])
+    )
+    assert fingerprint != get_environment_fingerprint(
+        parser.parse_args(["--format=json"])
+    )
+
+    (tmp_path / "foo" / "module.py").write_text("", encoding="utf-8")
+    assert fingerprint == get_environment_fingerprint(parser.parse_args([]))
+    (tmp_path / "bar-1.0.dist-info").mkdir()
+    assert fingerprint != get_environment_fingerprint(parser.parse_args([]))
+
+
+def test_create_output_string_with_cache_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    site_packages = tmp_path / "site-packages"
+    make_dist_info(site_packages, "foo", "1.0")
+    monkeypatch.setattr(sys, "path", [str(site_packages)])
+    parser = create_parser()
+    cache_dir_args = ["--cache-dir", str(tmp_path / "cache")]
+    args = parser.parse_args([*cache_dir_args, "--cache-report"])
+
+    output_string = create_output_string(args)
+    assert "foo" in output_string
+
+    def get_packages_not_called(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("get_packages() called")
+
+    with monkeypatch.context() as m:
+        m.setattr(piplicenses, "get_packages", get_packages_not_called)
+        assert create_output_string(args) == output_string
+
+        # the whole report is only reused with --cache-report
+        with pytest.raises(AssertionError):
+            create_output_string(parser.parse_args(cache_dir_args))
+
+    make_dist_info(site_packages, "bar", "2.0")
+    assert "bar" in create_output_string(args)
+
+
+def test_snapshots(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, opened_metadata: list[str]
+) -> None:
+    system = tmp_path / "system"
+    venv = tmp_path / "venv"
+    for site_dir, name, version, license_name in (
+        (system, "foo", "1.0", "MIT"),
+        (system, "bar", "1.0", "MIT"),
+        (venv, "bar", "2.0", "BSD"),
+    ):
+        make_dist_info(
+            site_dir, name, version, license_name, license_name=license_name
+        )
+
+    snapshot_path = write_snapshot(str(system))
+    assert snapshot_path == system / ".pip-licenses-snapshot.json"
+    snapshot = read_snapshot(str(system))
+    assert snapshot is not None
+    assert sorted(dist.metadata["Name"] for dist in snapshot) == ["bar", "foo"]
+    assert read_snapshot(str(venv)) is None
+
+    monkeypatch.setattr(sys, "path", [str(venv), str(system)])
+    parser = create_parser()
+    args = parser.parse_args(["--with-license-file", "--format=json"])
+    snapshots_args = parser.parse_args(
+        ["--with-license-file", "--format=json", "--snapshots"]
+    )
+
+    pkgs = list(get_packages(args))
+    opened_metadata.clear()
+    assert list(get_packages(snapshots_args)) == pkgs
+    assert [(pkg["name"], pkg["version"]) for pkg in pkgs] == [
+        ("bar", "2.0"),
+        ("foo", "1.0"),
+    ]
+    # only the venv is scanned
+    assert opened_metadata == ["bar-2.0.dist-info"]
+
+    # the snapshotted directory is not scanned for the fingerprint either
+    fingerprint = get_environment_fingerprint(snapshots_args)
+    (system / "baz-1.0.dist-info").mkdir()
+    assert get_environment_fingerprint(snapshots_args) == fingerprint
+    assert get_environment_fingerprint(args) != fingerprint
+
+    # snapshots of other versions are ignored
+    monkeypatch.setattr(piplicenses, "__version__", "0.0.0")
+    assert read_snapshot(str(system)) is None
+
+
+def test_get_packages_with_state_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, opened_metadata: list[str]
+) -> None:
+    site_packages = tmp_path / "site-packages"
+    for name in ("foo", "bar"):
+        os.utime(make_dist_info(site_packages, name, "1.0"), ns=(1, 1))
+
+    monkeypatch.setattr(sys, "path", [str(site_packages)])
+    parser = create_parser()
+    state_file = tmp_path / "state.json"
+    args = parser.parse_args(
+        ["--state-file", str(state_file), "--filter-strings"]
+    )
+
+    def get_licenses() -> list[tuple[str | list[str], ...]]:
+        return sorted(
+            (pkg["name"], pkg["license"])
+            for pkg in get_packages(args, get_output_fields(args))
+        )
+
+    assert get_licenses() == [("bar", "MIT"), ("foo", "MIT")]
+    assert sorted(opened_metadata) == [
+        "bar-1.0.dist-info",
+        "foo-1.0.dist-info",
+    ]
+
+    opened_metadata.clear()
+    assert get_licenses() == [("bar", "MIT"), ("foo", "MIT")]
+    assert opened_metadata == []
+
+    # the changed distributions are extracted again
+    dist_info = make_dist_info(site_packages, "bar", "1.0", license_name="BSD")
+    os.utime(dist_info, ns=(2, 2))
+    assert get_licenses() == [("bar", "BSD"), ("foo", "MIT")]
+    assert opened_metadata == ["bar-1.0.dist-info"]
+
+    # the removed distributions are forgotten
+    shutil.rmtree(site_packages / "foo-1.0.dist-info")
+    assert get_licenses() == [("bar", "BSD")]
+    state = json.loads(state_file.read_text())
+    assert list(state["distributions"]) == [
+        str(site_packages / "bar-1.0.dist-info")
+    ]
+
+    # the state is discarded when other fields are extracted
+    opened_metadata.clear()
+    args = parser.parse_args(["--state-file", str(state_file), "--with-urls"])
+    assert get_licenses() == [("bar", "BSD")]
+    assert opened_metadata == ["bar-1.0.dist-info"]
+
+
+def test_get_packages_with_processes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    site_packages = tmp_path / "site-packages"
+    names = [f"package{index}" for index in range(10)]
+    for name in names:
+        make_dist_info(site_packages, name, "1.0")
+
+    monkeypatch.setattr(sys, "path", [str(site_packages)])
+    parser = create_parser()
+    state_file = tmp_path / "state.json"
+    args = parser.parse_args(
+        ["--processes=2", "--state-file", str(state_file)]
+    )
+    pkgs = list(get_packages(args, get_output_fields(args)))
+    assert sorted(pkg["name"] for pkg in pkgs) == names
+
+    # the distributions collected by the worker processes are saved
+    state = json.loads(state_file.read_text())
+    assert sorted(state["distributions"]) == sorted(
+        str(site_packages / f"{name}-1.0.dist-info") for name in names
+    )
+    # and reused by the next run
+    args = parser.parse_args(["--state-file", str(state_file)])
+    assert list(get_packages(args, get_output_fields(args))) == pkgs
+
+
+def test_get_packages_with_several_pythons(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, opened_metadata: list[str]
+) -> None:
+    first, second = tmp_path / "first", tmp_path / "second"
+    shared = make_dist_info(first, "foo", "1.0")
+    make_dist_info(first, "bar", "1.0")
+    make_dist_info(second, "baz", "1.0")
+    (second / shared.name).symlink_to(shared)
+    sys_paths = {"first/python": [str(first)], "second/python": [str(second)]}
+
+    monkeypatch.setattr(piplicenses, "get_python_sys_path", sys_paths.get)
+    python_file = tmp_path / "pythons.txt"
+    python_file.write_text(
+        "# environments\nsecond/python\n\nfirst/python\n", encoding="utf-8"
+    )
+    parser = create_parser()
+    args = parser.parse_args(
+        ["--python", "first/python", "--python-file", str(python_file)]
+    )
+    assert piplicenses.get_pythons(args) == ["first/python", "second/python"]
+    args.python, args.python_file = "first/python", None
+    assert piplicenses.get_pythons(args) == ["first/python"]
+    args.python_file = str(python_file)
+    assert get_output_fields(args) == [
+        "Name",
+        "Version",
+        "License",
+        "Environment",
+    ]
+
+    pkgs = [
+        (pkg["name"], pkg["environment"])
+        for pkg in get_packages(args, get_output_fields(args))
+    ]
+    assert sorted(pkgs) == [
+        ("bar", "first/python"),
+        ("baz", "second/python"),
+        ("foo", "first/python"),
+        ("foo", "second/python"),
+    ]
+    # the distribution shared by both environments is extracted once
+    assert sorted(opened_metadata) == [
+        "bar-1.0.dist-info",
+        "baz-1.0.dist-info",
+        "foo-1.0.dist-info",
+    ]
+
+    args = parser.parse_args(
+        ["--python", "first/python", "second/python", "--format=json"]
+    )
+    assert {
+        "Name": "baz",
+        "Version": "1.0",
+        "Environment": "second/python",
+        "License": "MIT",
+    } in json.loads(create_output_string(args))
+
+
+def test_collect_in_target(monkeypatch: pytest.MonkeyPatch) -> None:
+    # the host scans the same sys.path as the target python
+    target_sys_path = piplicenses.get_python_sys_path(sys.executable)
+    monkeypatch.setattr(sys, "path", target_sys_path)
+    parser = create_parser()
+    argv = ["--with-system", "--with-license-file", "--with-urls"]
+    args = parser.parse_args(argv)
+    target_args = parser.parse_args([*argv, "--collect-in-target"])
+
+    def sort_key(pkg_info: dict) -> tuple[str, str]:
+        return (pkg_info["name"], pkg_info["version"])
+
+    pkgs = sorted(get_packages(args, get_output_fields(args)), key=sort_key)
+    target_pkgs = sorted(
+        get_packages(target_args, get_output_fields(target_args)),
+        key=sort_key,
+    )
+    assert target_pkgs == pkgs
+
+    monkeypatch.setattr(
+        piplicenses, "TARGET_COLLECTOR_SCRIPT", "import sys; sys.exit(3)"
+    )
+    with pytest.raises(SystemExit):
+        list(get_packages(target_args))
+
+
+def test_collect_in_target_ignores_cwd(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    make_dist_info(tmp_path, "zzzfake", "1.0")
+    monkeypatch.chdir(tmp_path)
+    parser = create_parser()
+    args = parser.parse_args(["--python", sys.executable])
+    target_args = parser.parse_args(
+        ["--python", sys.executable, "--collect-in-target"]
+    )
+
+    for args_ in (args, target_args):
+        names = [pkg["name"] for pkg in get_packages(args_)]
+        assert names
+        assert "zzzfake" not in names
+
+
+def test_python_search_paths_cache(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    python = tmp_path / "bin" / "python"
+    python.parent.mkdir()
+    python.touch()
+    site_packages = tmp_path / "site-packages"
+    site_packages.mkdir()
+    probed: list[str] = []
+
+    def get_python_sys_path(executable: str) -> list[str]:
+        probed.append(executable)
+        return [str(site_packages), str(site_packages)]
+
+    monkeypatch.setattr(
+        piplicenses, "get_python_sys_path", get_python_sys_path
+    )
+    cache = PackageInfoCache(str(tmp_path / "cache"), 1024 * 1024, [])
+
+    def get_search_paths() -> list[str]:
+        return piplicenses.get_python_search_paths(str(python), cache)
+
+    assert get_search_paths() == [str(site_packages)]
+    assert get_search_paths() == [str(site_packages)]
+    assert len(probed) == 1
+
+    # probed again when a search path changes, e.g. a .pth file is added
+    (site_packages / "extra.pth").touch()
+    os.utime(site_packages, ns=(1, 1))
+    assert get_search_paths() == [str(site_packages)]
+    assert len(probed) == 2
+
+    # or when the executable changes
+    os.utime(python, ns=(1, 1))
+    assert get_search_paths() == [str(site_packages)]
+    assert get_search_paths() == [str(site_packages)]
+    assert len(probed) == 3
+
+
+def test_package_index(tmp_path: Path) -> None:
+    def get_licenses() -> list[tuple[str | list[str], ...]]:
+        (dists,) = index.distributions().values()
+        return sorted(
+            (dist.pkg_info["name"], dist.pkg_info["license"]) for dist in dists
+        )
+
+    make_dist_info(tmp_path, "foo", "1.0")
+    index = PackageIndex([str(tmp_path), str(tmp_path / "missing")])
+    assert list(index.distributions()) == [
+        str(tmp_path),
+        str(tmp_path / "missing"),
+    ]
+    del index.entries[str(tmp_path / "missing")]
+    assert get_licenses() == [("foo", "MIT")]
+    assert not index.refresh()
+
+    make_dist_info(tmp_path, "bar", "1.0")
+    assert index.refresh()
+    assert get_licenses() == [("bar", "MIT"), ("foo", "MIT")]
+
+    dist_info = make_dist_info(tmp_path, "foo", "1.0", license_name="BSD")
+    os.utime(dist_info, ns=(1, 1))
+    assert index.refresh()
+    assert get_licenses() == [("bar", "MIT"), ("foo", "BSD")]
+
+    shutil.rmtree(tmp_path / "bar-1.0.dist-info")
+    assert index.refresh()
+    assert get_licenses() == [("foo", "BSD")]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires Unix sockets")
+def test_query_server(tmp_path: Path) -> None:
+    site_packages = tmp_path / "site-packages"
+    make_dist_info(site_packages, "foo", "1.0")
+    index = PackageIndex([str(site_packages)])
+    socket_path = str(tmp_path / "pip-licenses.sock")
+    server = piplicenses.QueryServer(socket_path, index, create_parser())
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}
+    )
+    thread.start()
+    try:
+        response = query_server(socket_path, ["--format=json"])
+        assert response["exit"] == 0
+        assert json.loads(response["output"]) == [
+            {"License": "MIT", "Name": "foo", "Version": "1.0"}
+        ]
+        assert response["stderr"] == ""
+
+        response = query_server(socket_path, ["--fail-on=MIT"])
+        assert response["exit"] == 1
+        assert response["output"] is None
+        assert "fail-on license MIT was found" in response["stderr"]
+
+        response = query_server(socket_path, ["--jobs=0"])
+        assert response["exit"] == 2
+        assert "--jobs" in response["stderr"]
+
+        response = query_server(socket_path, ["--with-license-file"])
+        assert "best paired with --format=json" in response["stderr"]
+
+        # the exceptions are answered, and the server keeps running
+        response = query_server(socket_path, ["--order=license", "--from=all"])
+        assert response["exit"] == 1
+        assert response["output"] is None
+        assert "ValueError" in response["stderr"]
+        assert query_server(socket_path, ["--format=json"])["exit"] == 0
+
+        # the clients cannot make the server write files
+        for option in ("--cache-dir", "--state-file"):
+            response = query_server(
+                socket_path, [option, str(tmp_path / "written")]
+            )
+            assert response["exit"] == 2
+            assert f"{option} is not allowed in queries" in response["stderr"]
+        assert not (tmp_path / "written").exists()
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def test_parse_dist_info_dirname() -> None:
+    assert parse_dist_info_dirname("Foo_Bar-1.0.dist-info") == (
+        "foo-bar",
+        "1.0",
+    )
+    assert parse_dist_info_dirname("foo-1.0+local.DIST-INFO") == (
+        "foo",
+        "1.0+local",
+    )
+    assert parse_dist_info_dirname("foo-1.0-py3.9.egg-info") is None
+    assert parse_dist_info_dirname("foo.dist-info") is None
+    assert parse_dist_info_dirname("foo-bar-1.0.dist-info") is None
+    assert parse_dist_info_dirname("-1.0.dist-info") is None
+
+
+@pytest.fixture
+def opened_metadata(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Record the names of the metadata files read_metadata_headers() reads."""
+    opened: list[str] = []
+    read_metadata_headers_orig = piplicenses.read_metadata_headers
+
+    def recorded_read_metadata_headers(
+        path: Path,
+    ) -> piplicenses.MetadataHeaders | None:
+        opened.append(path.name)
+        return read_metadata_headers_orig(path)
+
+    monkeypatch.setattr(
+        piplicenses, "read_metadata_headers", recorded_read_metadata_headers
+    )
+    return opened
+
+
+def test_get_packages_filters_on_dist_info_dirname(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, opened_metadata: list[str]
+) -> None:
+    for name, version in (("foo", "1.0"), ("bar", "2.0"), ("pip", "24.0")):
+        make_dist_info(tmp_path, name, version)
+    make_dist_info(tmp_path, "baz", "3.0", dirname="baz-3.0-py3.9.egg-info")
+
+    monkeypatch.setattr(sys, "path", [str(tmp_path)])
+    parser = create_parser()
+
+    args = parser.parse_args(["--discovery=scandir", "--ignore-packages=bar"])
+    assert sorted(pkg["name"] for pkg in get_packages(args)) == ["baz", "foo"]
+    # bar and pip (a system package) are excluded before reading METADATA,
+    # the name of baz is ambiguous so its metadata is read
+    assert sorted(opened_metadata) == [
+        "baz-3.0-py3.9.egg-info",
+        "foo-1.0.dist-info",
+    ]
+
+    opened_metadata.clear()
+    args = parser.parse_args(
+        ["--discovery=scandir", "--ignore-packages", "foo:1.0", "baz:3.0"]
+    )
+    assert sorted(pkg["name"] for pkg in get_packages(args)) == ["bar"]
+    # versions are checked on the metadata
+    assert sorted(opened_metadata) == [
+        "bar-2.0.dist-info",
+        "baz-3.0-py3.9.egg-info",
+        "foo-1.0.dist-info",
+    ]
+
+    opened_metadata.clear()
+    args = parser.parse_args(["--discovery=scandir", "--packages=foo"])
+    assert [pkg["name"] for pkg in get_packages(args)] == ["foo"]
+    # only the requested package is looked up
+    assert opened_metadata == ["foo-1.0.dist-info"]
+
+
+def test_map_with_jobs() -> None:
+    values = list(range(50))
+
+    assert list(map_with_jobs(str, values, 1)) == list(map(str, values))
+    assert list(map_with_jobs(str, values, 8)) == list(map(str, values))
+
+    # consumer stops early, pending work is cancelled without errors
+    results = map_with_jobs(str, values, 8)
+    assert next(results) == "0"
+    results.close()
+
+    # only a bounded window of items is submitted ahead of the consumer
+    pulled = []
+
+    def pull() -> Iterator[int]:
+        for value in values:
+            pulled.append(value)
+            yield value
+
+    results = map_with_jobs(str, pull(), 4)
+    assert next(results) == "0"
+    assert len(pulled) == 9
+    results.close()
+
+
+def test_get_default_jobs(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: True, raising=False)
+    assert get_default_jobs() == 1
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: False)
+    assert get_default_jobs() == 4
+    assert create_parser().parse_args([]).jobs == 4
+
+
 def test_enums() -> None:
     class TestEnum(Enum):
         PLAIN = P = auto()
@@ -1161,6 +2695,47 @@ def test_verify_args(
     for arg in ("invalid code", "--filter-code-page"):
         assert arg in capture
 
+    # invalid number of workers
+    with pytest.raises(SystemExit) as ex:
+        parser.parse_args(["--jobs=0"])
+    capture = capsys.readouterr().err
+    for arg in ("--jobs", "positive"):
+        assert arg in capture
+
+    with pytest.raises(SystemExit) as ex:
+        parser.parse_args(["--processes=0"])
+    capture = capsys.readouterr().err
+    for arg in ("--processes", "positive"):
+        assert arg in capture
+
+    # invalid cell width
+    with pytest.raises(SystemExit) as ex:
+        parser.parse_args(["--max-cell-width=-1"])
+    capture = capsys.readouterr().err
+    for arg in ("--max-cell-width", "positive"):
+        assert arg in capture
+
+    # invalid cache size
+    with pytest.raises(SystemExit) as ex:
+        parser.parse_args(["--cache-max-size=0"])
+    capture = capsys.readouterr().err
+    for arg in ("--cache-max-size", "positive"):
+        assert arg in capture
+
+    # --cache-dir missing
+    with pytest.raises(SystemExit) as ex:
+        parser.parse_args(["--cache-report"])
+    capture = capsys.readouterr().err
+    for arg in ("--cache-report", "--cache-dir"):
+        assert arg in capture
+
+    # server and client at once
+    with pytest.raises(SystemExit) as ex:
+        parser.parse_args(["--serve=a.sock", "--query=a.sock"])
+    capture = capsys.readouterr().err
+    for arg in ("--serve", "--query"):
+        assert arg in capture
+
 
 def test_normalize_pkg_name() -> None:
     expected_normalized_name = "pip-licenses"